@@ -0,0 +1,216 @@
+"""Disk cache for page embeddings keyed by content hash."""
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, List, Optional
+import numpy as np
+from PIL import Image
+from utils import get_backend_dir, ensure_directory, normalize_rows, prune_oldest_files
+
+
+log = logging.getLogger(__name__)
+
+# Recently used entries are also kept in memory, so repeated pages within
+# and across runs skip the disk read
+MEMORY_CACHE_SIZE = 4096
+_memory_cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
+_memory_cache_lock = threading.Lock()
+
+# Entries kept on disk; the oldest written are pruned beyond this
+MAX_DISK_CACHE_ENTRIES = int(os.getenv("EMB_CACHE_MAX_ENTRIES", 50000))
+# Upper bound on the files in the cache directory, counted on first save
+# and raised by every save, so pruning only lists the directory when needed
+_disk_entry_count: Optional[int] = None
+_disk_cache_lock = threading.Lock()
+
+
+def _remember(key: str, embedding: np.ndarray):
+    """Add an entry to the in-memory LRU, evicting the oldest when full."""
+    with _memory_cache_lock:
+        _memory_cache[key] = embedding
+        _memory_cache.move_to_end(key)
+        if len(_memory_cache) > MEMORY_CACHE_SIZE:
+            _memory_cache.popitem(last=False)
+
+
+def get_cache_dir() -> str:
+    """Get the directory holding cached embeddings."""
+    return os.path.join(get_backend_dir(), "data", "emb_cache")
+
+
+def image_cache_key(image: Image.Image, encoder_id: str) -> str:
+    """
+    Compute the cache key for an image embedding.
+
+    Args:
+        image: Cropped PIL Image of the page content
+        encoder_id: Encoder producing the embedding (embeddings.get_image_encoder_id())
+
+    Returns:
+        Key identifying the image content and encoder
+    """
+    digest = hashlib.sha256()
+    digest.update(f"{encoder_id}\0{image.mode}:{image.width}x{image.height}:".encode())
+    digest.update(image.tobytes())
+    return f"img-{digest.hexdigest()}"
+
+
+def text_cache_key(text: str, encoder_id: str) -> Optional[str]:
+    """
+    Compute the cache key for a text embedding.
+
+    Args:
+        text: Extracted text of the page
+        encoder_id: Encoder producing the embedding (embeddings.TEXT_ENCODER_ID)
+
+    Returns:
+        Key identifying the text content and encoder, or None for empty text,
+        which is embedded without being cached
+    """
+    if not text.strip():
+        return None
+    digest = hashlib.sha256()
+    digest.update(f"{encoder_id}\0".encode())
+    digest.update(text.encode('utf-8'))
+    return f"txt-{digest.hexdigest()}"
+
+
+def load_cached_embedding(key: str) -> Optional[np.ndarray]:
+    """
+    Look up a cached embedding.
+
+    Args:
+        key: Cache key from image_cache_key or text_cache_key
+
+    Returns:
+        Embedding vector, or None on a cache miss
+    """
+    with _memory_cache_lock:
+        embedding = _memory_cache.get(key)
+        if embedding is not None:
+            _memory_cache.move_to_end(key)
+            return embedding
+
+    path = os.path.join(get_cache_dir(), f"{key}.npy")
+    if not os.path.exists(path):
+        return None
+
+    try:
+        embedding = np.load(path)
+        _remember(key, embedding)
+        return embedding
+    except Exception as e:
+        # Treat unreadable entries as misses; they are overwritten on save
+        log.warning("Ignoring corrupt embedding cache entry %s: %s", path, e)
+        return None
+
+
+def save_cached_embedding(key: str, embedding: np.ndarray):
+    """
+    Store an embedding in the cache.
+
+    Args:
+        key: Cache key from image_cache_key or text_cache_key
+        embedding: Embedding vector
+    """
+    cache_dir = get_cache_dir()
+    ensure_directory(cache_dir)
+
+    path = os.path.join(cache_dir, f"{key}.npy")
+    tmp_path = f"{path}.tmp"
+
+    # Write to a temp file and rename so readers never see a partial entry
+    with open(tmp_path, 'wb') as f:
+        np.save(f, embedding)
+    os.replace(tmp_path, path)
+    _remember(key, embedding)
+
+    global _disk_entry_count
+    with _disk_cache_lock:
+        if _disk_entry_count is None:
+            _disk_entry_count = _count_disk_entries(cache_dir)
+        else:
+            _disk_entry_count += 1
+        if _disk_entry_count > MAX_DISK_CACHE_ENTRIES:
+            _disk_entry_count = prune_cache(MAX_DISK_CACHE_ENTRIES)
+
+
+def _count_disk_entries(cache_dir: str) -> int:
+    """Count the entries in the cache directory."""
+    with os.scandir(cache_dir) as it:
+        return sum(1 for entry in it if entry.name.endswith(".npy"))
+
+
+def prune_cache(max_entries: int = MAX_DISK_CACHE_ENTRIES) -> int:
+    """
+    Delete the oldest written disk entries beyond max_entries.
+
+    Entries keyed to an encoder that is no longer used are never read
+    again, so they age out here too.
+
+    Args:
+        max_entries: Number of entries to keep
+
+    Returns:
+        Number of entries left on disk
+    """
+    remaining, removed = prune_oldest_files(get_cache_dir(), ".npy", max_entries)
+    if removed:
+        log.debug("Embedding cache: pruned %d entries", removed)
+    return remaining
+
+
+def embed_with_cache(items: List, key_fn: Callable, embed_fn: Callable, encoder_id: str) -> np.ndarray:
+    """
+    Embed a list of images or texts, reusing cached results.
+
+    Only items missing from the embedding cache are passed to embed_fn,
+    in a single batch; their results are written back to the cache.
+    Items whose key is None (empty page text) are always embedded and
+    never cached.
+
+    Args:
+        items: Cropped PIL Images or page texts
+        key_fn: Function mapping an item and encoder_id to its cache key
+        embed_fn: Batch embedding function returning an (N, D) array
+        encoder_id: Identity of the encoder behind embed_fn, so entries from
+            a different backend or model are never reused
+
+    Returns:
+        L2-normalized float32 array of shape (len(items), D)
+    """
+    if not items:
+        return embed_fn([])
+
+    keys = [key_fn(item, encoder_id) for item in items]
+
+    # Look up each distinct item once; repeated pages share one entry
+    entries = {}
+    misses = []  # First index of each uncached key, and every uncacheable item
+    for idx, key in enumerate(keys):
+        if key is None:
+            misses.append(idx)
+            continue
+        if key in entries:
+            continue
+        entries[key] = load_cached_embedding(key)
+        if entries[key] is None:
+            misses.append(idx)
+
+    new_embeddings = embed_fn([items[i] for i in misses])
+    uncached = {}
+    for row, idx in enumerate(misses):
+        if keys[idx] is None:
+            uncached[idx] = new_embeddings[row]
+            continue
+        entries[keys[idx]] = new_embeddings[row]
+        save_cached_embedding(keys[idx], new_embeddings[row])
+
+    log.debug("Embedding cache: %d reused, %d embedded", len(keys) - len(misses), len(misses))
+
+    # Normalize again in case the cache holds entries written before ingest-time normalization
+    return normalize_rows(np.stack([
+        entries[key] if key is not None else uncached[idx] for idx, key in enumerate(keys)
+    ]))
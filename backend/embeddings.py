@@ -1,29 +1,133 @@
 """Embedding generation for images and text using CLIP and OpenAI."""
 import os
-from typing import List, Optional
+import threading
+from contextlib import nullcontext
+from typing import List, Optional, Tuple
 import numpy as np
+import torch
 from sentence_transformers import SentenceTransformer
 from openai import OpenAI
+import tiktoken
 from PIL import Image
-import io
-import base64
+from utils import normalize_rows, get_backend_dir
+# Use SimSIMD's SIMD distance kernels if available, fallback to NumPy
+try:
+    import simsimd
+    USE_SIMSIMD = True
+except ImportError:
+    USE_SIMSIMD = False
+# Run an exported INT8 CLIP vision encoder with ONNX Runtime on CPU if available
+try:
+    import onnxruntime as ort
+    from transformers import CLIPImageProcessor
+    USE_ONNXRUNTIME = True
+except ImportError:
+    USE_ONNXRUNTIME = False
 
 
 # Initialize models (lazy loading)
 _image_model = None
+_image_model_lock = threading.Lock()
+_onnx_image_encoder = None
 _openai_client = None
+_tokenizer = None
+
+IMAGE_MODEL_NAME = 'clip-ViT-L-14'
+TEXT_MODEL_NAME = 'text-embedding-3-small'
+# Identifies generate_text_embeddings_batch's encoder in cache keys
+TEXT_ENCODER_ID = f"openai:{TEXT_MODEL_NAME}"
+
+# Output dimensions of clip-ViT-L-14 and text-embedding-3-small
+IMAGE_EMBEDDING_DIM = 768
+TEXT_EMBEDDING_DIM = 1536
+
+# Input limit of text-embedding-3-small
+MAX_TEXT_TOKENS = 8191
+# Total tokens the embeddings endpoint accepts across all inputs of one request
+MAX_REQUEST_TOKENS = 300000
+
+# File name of the quantized vision encoder written by export_onnx.py
+ONNX_IMAGE_MODEL_FILENAME = "clip-vit-l-14-vision.int8.onnx"
+
+
+def get_image_device() -> str:
+    """Get the torch device used for CLIP inference."""
+    return 'cuda' if torch.cuda.is_available() else 'cpu'
 
 
 def get_image_model():
     """Get or initialize the CLIP image embedding model."""
     global _image_model
-    if _image_model is None:
-        print("Loading CLIP model (this may take a few minutes on first run)...")
-        _image_model = SentenceTransformer('clip-ViT-L-14')
-        print("CLIP model loaded successfully!")
+    with _image_model_lock:
+        if _image_model is None:
+            # Cap intra-op threads so concurrent workers don't oversubscribe cores
+            num_threads = int(os.getenv('TORCH_NUM_THREADS', min(4, os.cpu_count() or 1)))
+            torch.set_num_threads(num_threads)
+            
+            device = get_image_device()
+            print(f"Loading CLIP model on {device} (this may take a few minutes on first run)...")
+            _image_model = SentenceTransformer(IMAGE_MODEL_NAME, device=device)
+            print("CLIP model loaded successfully!")
     return _image_model
 
 
+def get_onnx_model_dir() -> str:
+    """Get the directory holding the exported ONNX vision encoder."""
+    return os.getenv('CLIP_ONNX_DIR', os.path.join(get_backend_dir(), "data", "models"))
+
+
+def _get_onnx_image_model_path() -> Optional[str]:
+    """Get the path of the ONNX vision encoder if it will be used on this host, else None."""
+    if not USE_ONNXRUNTIME or get_image_device() == 'cuda':
+        return None
+    model_path = os.path.join(get_onnx_model_dir(), ONNX_IMAGE_MODEL_FILENAME)
+    return model_path if os.path.exists(model_path) else None
+
+
+def get_image_encoder_id() -> str:
+    """
+    Identify the encoder generate_image_embeddings_batch currently uses.
+    
+    The backends produce slightly different vectors for the same image, so
+    cached embeddings are keyed by this as well as by content.
+    
+    Returns:
+        Backend, precision and model name, e.g. "torch-fp16:clip-ViT-L-14"
+    """
+    if _get_onnx_image_model_path() is not None:
+        return f"onnx-int8:{ONNX_IMAGE_MODEL_FILENAME}"
+    precision = 'fp16' if get_image_device() == 'cuda' else 'fp32'
+    return f"torch-{precision}:{IMAGE_MODEL_NAME}"
+
+
+def get_onnx_image_encoder():
+    """
+    Get or initialize the ONNX Runtime CLIP vision encoder.
+    
+    The encoder is only used on CPU-only hosts where onnxruntime is installed
+    and export_onnx.py has been run; on GPU the PyTorch fp16 path is faster.
+    
+    Returns:
+        Tuple of (InferenceSession, CLIPImageProcessor), or None if unavailable
+    """
+    global _onnx_image_encoder
+    model_path = _get_onnx_image_model_path()
+    if model_path is None:
+        return None
+    model_dir = os.path.dirname(model_path)
+    
+    with _image_model_lock:
+        if _onnx_image_encoder is None:
+            print(f"Loading ONNX CLIP vision encoder from {model_path}...")
+            options = ort.SessionOptions()
+            options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+            session = ort.InferenceSession(model_path, sess_options=options, providers=['CPUExecutionProvider'])
+            processor = CLIPImageProcessor.from_pretrained(model_dir)
+            _onnx_image_encoder = (session, processor)
+            print("ONNX CLIP vision encoder loaded successfully!")
+    return _onnx_image_encoder
+
+
 def get_openai_client():
     """Get or initialize OpenAI client."""
     global _openai_client
@@ -35,7 +139,31 @@ def get_openai_client():
     return _openai_client
 
 
-def generate_image_embedding(image: Image.Image) -> List[float]:
+def warmup():
+    """
+    Load the CLIP encoder, tokenizer and OpenAI client ahead of the first request.
+    
+    A missing OpenAI API key is reported but not raised, so the server can
+    still start; text embedding calls raise as usual later.
+    """
+    if get_onnx_image_encoder() is None:
+        get_image_model()
+    get_tokenizer()
+    try:
+        get_openai_client()
+    except ValueError as e:
+        print(f"Warning: {str(e)}")
+
+
+def get_tokenizer():
+    """Get or initialize the tokenizer used by text-embedding-3-small."""
+    global _tokenizer
+    if _tokenizer is None:
+        _tokenizer = tiktoken.get_encoding("cl100k_base")
+    return _tokenizer
+
+
+def generate_image_embedding(image: Image.Image) -> np.ndarray:
     """
     Generate image embedding using CLIP-ViT-L-14.
     
@@ -43,14 +171,109 @@ def generate_image_embedding(image: Image.Image) -> List[float]:
         image: PIL Image
     
     Returns:
-        List of float values representing the embedding vector
+        float32 embedding vector
     """
+    return generate_image_embeddings_batch([image])[0]
+
+
+def generate_image_embeddings_batch(images: List[Image.Image], batch_size: Optional[int] = None) -> np.ndarray:
+    """
+    Generate image embeddings for many images in a single CLIP encode call.
+    
+    On GPU the forward pass runs under fp16 autocast; on CPU the exported
+    INT8 ONNX encoder is used when present. Results are always float32.
+    
+    Args:
+        images: List of PIL Images
+        batch_size: Number of images per forward pass (default: CLIP_BATCH_SIZE
+            environment variable, else 32 on GPU and 16 on CPU)
+    
+    Returns:
+        float32 array of shape (len(images), IMAGE_EMBEDDING_DIM), L2-normalized
+    """
+    if not images:
+        return np.empty((0, IMAGE_EMBEDDING_DIM), dtype=np.float32)
+    
+    onnx_encoder = get_onnx_image_encoder()
+    if onnx_encoder is not None:
+        return _encode_images_onnx(onnx_encoder, images, batch_size or int(os.getenv('CLIP_BATCH_SIZE', 16)))
+    
     model = get_image_model()
-    embedding = model.encode(image, convert_to_numpy=True)
-    return embedding.tolist()
+    use_cuda = model.device.type == 'cuda'
+    if batch_size is None:
+        batch_size = int(os.getenv('CLIP_BATCH_SIZE', 32 if use_cuda else 16))
+    
+    # Weights stay fp32 and autocast runs the matmuls/convs in fp16, which
+    # avoids dtype mismatches with the processor's fp32 pixel tensors
+    autocast = torch.autocast(device_type='cuda', dtype=torch.float16) if use_cuda else nullcontext()
+    with torch.inference_mode(), autocast:
+        embeddings = model.encode(
+            images,
+            batch_size=batch_size,
+            convert_to_numpy=True,
+            normalize_embeddings=True,
+            show_progress_bar=False
+        )
+    return np.asarray(embeddings, dtype=np.float32)
+
+
+def _encode_images_onnx(onnx_encoder, images: List[Image.Image], batch_size: int) -> np.ndarray:
+    """Embed images with the ONNX Runtime vision encoder, batch_size at a time."""
+    session, processor = onnx_encoder
+    embeddings = []
+    for start in range(0, len(images), batch_size):
+        pixel_values = processor(images=images[start:start + batch_size], return_tensors='np')['pixel_values']
+        outputs = session.run(None, {'pixel_values': pixel_values.astype(np.float32)})
+        embeddings.append(outputs[0])
+    return normalize_rows(np.concatenate(embeddings))
+
+
+def truncate_texts_to_tokens(texts: List[str], max_tokens: int = MAX_TEXT_TOKENS) -> Tuple[List[str], List[int]]:
+    """
+    Truncate texts to the embedding model's per-input token limit.
+    
+    Args:
+        texts: Text strings to truncate
+        max_tokens: Maximum number of tokens to keep per text
+    
+    Returns:
+        Tuple of (texts decoded from at most max_tokens tokens each, token count of each)
+    """
+    tokenizer = get_tokenizer()
+    # encode_ordinary treats special-token text as plain text, like
+    # disallowed_special=(), and the batch form tokenizes on several threads
+    token_lists = tokenizer.encode_ordinary_batch(texts)
+    
+    truncated, counts = [], []
+    for text, tokens in zip(texts, token_lists):
+        if len(tokens) > max_tokens:
+            text = tokenizer.decode(tokens[:max_tokens])
+        truncated.append(text)
+        counts.append(min(len(tokens), max_tokens))
+    return truncated, counts
+
 
+def _token_budget_batches(token_counts: List[int], batch_size: int, max_tokens: int) -> List[Tuple[int, int]]:
+    """
+    Split inputs into consecutive (start, end) ranges for embedding requests.
+    
+    Each range holds at most batch_size inputs and, unless a single input
+    exceeds it, at most max_tokens tokens.
+    """
+    batches = []
+    start = 0
+    total = 0
+    for idx, count in enumerate(token_counts):
+        if idx > start and (idx - start >= batch_size or total + count > max_tokens):
+            batches.append((start, idx))
+            start = idx
+            total = 0
+        total += count
+    batches.append((start, len(token_counts)))
+    return batches
 
-def generate_text_embedding(text: str) -> List[float]:
+
+def generate_text_embedding(text: str) -> np.ndarray:
     """
     Generate text embedding using OpenAI text-embedding-3-small.
     
@@ -58,46 +281,75 @@ def generate_text_embedding(text: str) -> List[float]:
         text: Text string to embed
     
     Returns:
-        List of float values representing the embedding vector
+        float32 embedding vector
+    """
+    return generate_text_embeddings_batch([text])[0]
+
+
+def generate_text_embeddings_batch(texts: List[str], batch_size: int = 100) -> np.ndarray:
     """
+    Generate text embeddings for many strings with batched OpenAI requests.
+    
+    Args:
+        texts: List of text strings to embed
+        batch_size: Maximum number of strings sent per API request (requests
+            are also split to stay within MAX_REQUEST_TOKENS)
+    
+    Returns:
+        float32 array of shape (len(texts), TEXT_EMBEDDING_DIM), L2-normalized
+    """
+    if not texts:
+        return np.empty((0, TEXT_EMBEDDING_DIM), dtype=np.float32)
+    
     client = get_openai_client()
     
-    # Truncate text if too long (OpenAI has token limits)
-    # text-embedding-3-small supports up to 8191 tokens, roughly 30k characters
-    max_chars = 30000
-    if len(text) > max_chars:
-        text = text[:max_chars]
+    # Truncate text if too long (OpenAI has token limits), and split requests
+    # so none exceeds the endpoint's total token limit
+    texts, token_counts = truncate_texts_to_tokens(texts)
     
+    embeddings = []
     try:
-        response = client.embeddings.create(
-            model="text-embedding-3-small",
-            input=text
-        )
-        return response.data[0].embedding
+        for start, end in _token_budget_batches(token_counts, batch_size, MAX_REQUEST_TOKENS):
+            response = client.embeddings.create(
+                model=TEXT_MODEL_NAME,
+                input=texts[start:end]
+            )
+            # Results carry their input index; don't rely on response ordering
+            for item in sorted(response.data, key=lambda d: d.index):
+                embeddings.append(item.embedding)
     except Exception as e:
         raise Exception(f"Error generating text embedding: {str(e)}")
+    
+    return normalize_rows(embeddings)
 
 
-def cosine_similarity(vec1: List[float], vec2: List[float]) -> float:
+def cosine_similarity_matrix(matrix1: np.ndarray, matrix2: np.ndarray) -> np.ndarray:
     """
-    Calculate cosine similarity between two embedding vectors.
+    Calculate pairwise cosine similarity between the rows of two matrices.
+    
+    Uses SimSIMD's SIMD cosine kernel on float16 operands when available,
+    otherwise a normalized float32 matmul. Training embeddings are already
+    stored as float16, and SimSIMD accumulates float16 products in float32,
+    so the half-width operands only add input rounding (~5e-4 relative)
+    while halving the memory traffic of the pairwise pass.
     
     Args:
-        vec1: First embedding vector
-        vec2: Second embedding vector
+        matrix1: Array of shape (N, D)
+        matrix2: Array of shape (M, D)
     
     Returns:
-        Cosine similarity score between -1 and 1
+        float32 array of shape (N, M) with cosine similarity scores
     """
-    vec1 = np.array(vec1)
-    vec2 = np.array(vec2)
-    
-    dot_product = np.dot(vec1, vec2)
-    norm1 = np.linalg.norm(vec1)
-    norm2 = np.linalg.norm(vec2)
+    if USE_SIMSIMD:
+        matrix1 = np.ascontiguousarray(matrix1, dtype=np.float16)
+        matrix2 = np.ascontiguousarray(matrix2, dtype=np.float16)
+        distances = np.asarray(simsimd.cdist(matrix1, matrix2, metric="cosine"), dtype=np.float32)
+        return 1.0 - distances
     
-    if norm1 == 0 or norm2 == 0:
-        return 0.0
-    
-    return float(dot_product / (norm1 * norm2))
-
+    matrix1 = np.ascontiguousarray(matrix1, dtype=np.float32)
+    matrix2 = np.ascontiguousarray(matrix2, dtype=np.float32)
+    norms1 = np.linalg.norm(matrix1, axis=1, keepdims=True)
+    norms2 = np.linalg.norm(matrix2, axis=1, keepdims=True)
+    norms1[norms1 == 0] = 1.0
+    norms2[norms2 == 0] = 1.0
+    return (matrix1 / norms1) @ (matrix2 / norms2).T
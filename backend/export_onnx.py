@@ -0,0 +1,71 @@
+"""
+Export the CLIP vision encoder to ONNX and quantize it to INT8.
+
+Run once on the deployment host:
+
+    python export_onnx.py
+
+The quantized model and its image processor config are written to
+data/models (or CLIP_ONNX_DIR), where embeddings.py picks them up on CPU.
+"""
+import os
+import torch
+from sentence_transformers import SentenceTransformer
+from onnxruntime.quantization import quantize_dynamic, QuantType
+from embeddings import get_onnx_model_dir, ONNX_IMAGE_MODEL_FILENAME
+from utils import ensure_directory
+
+
+class CLIPVisionEncoder(torch.nn.Module):
+    """Wrap the CLIP image tower so it exports with a single pixel_values input."""
+
+    def __init__(self, clip_model):
+        super().__init__()
+        self.clip_model = clip_model
+
+    def forward(self, pixel_values):
+        return self.clip_model.get_image_features(pixel_values=pixel_values)
+
+
+def export_image_encoder(output_dir: str = None):
+    """
+    Export and quantize the clip-ViT-L-14 vision encoder.
+
+    Args:
+        output_dir: Directory to write the model to (default: get_onnx_model_dir())
+    """
+    if output_dir is None:
+        output_dir = get_onnx_model_dir()
+    ensure_directory(output_dir)
+
+    model = SentenceTransformer('clip-ViT-L-14', device='cpu')
+    clip = model[0]
+    encoder = CLIPVisionEncoder(clip.model).eval()
+
+    fp32_path = os.path.join(output_dir, "clip-vit-l-14-vision.onnx")
+    int8_path = os.path.join(output_dir, ONNX_IMAGE_MODEL_FILENAME)
+
+    print(f"Exporting vision encoder to {fp32_path}...")
+    dummy = torch.zeros(1, 3, 224, 224, dtype=torch.float32)
+    with torch.inference_mode():
+        torch.onnx.export(
+            encoder,
+            (dummy,),
+            fp32_path,
+            input_names=['pixel_values'],
+            output_names=['image_embeds'],
+            dynamic_axes={'pixel_values': {0: 'batch'}, 'image_embeds': {0: 'batch'}},
+            opset_version=17,
+        )
+
+    print(f"Quantizing weights to INT8 at {int8_path}...")
+    quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+    os.remove(fp32_path)
+
+    # Same resize/crop/normalize settings as the SentenceTransformer pipeline
+    clip.processor.image_processor.save_pretrained(output_dir)
+    print("Done.")
+
+
+if __name__ == "__main__":
+    export_image_encoder()
@@ -1,6 +1,11 @@
 """Inference pipeline for splitting composite PDFs based on training embeddings."""
 import os
+import logging
 from typing import List, Dict, Tuple, Optional, Callable
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import numpy as np
+from PIL import Image
 # Use pypdf (better maintained) if available, fallback to PyPDF2
 try:
     from pypdf import PdfReader, PdfWriter
@@ -8,112 +13,242 @@ try:
 except ImportError:
     from PyPDF2 import PdfReader, PdfWriter
     USE_PYPDF = False
-from pdf_processor import pdf_to_images, extract_text_from_pdf
+from pdf_processor import PdfContext
 from content_detector import detect_content_area, crop_to_content
-from embeddings import generate_image_embedding, generate_text_embedding, cosine_similarity
-from utils import load_embeddings
+from embeddings import (
+    generate_image_embeddings_batch, generate_text_embeddings_batch, cosine_similarity_matrix,
+    get_image_encoder_id, TEXT_ENCODER_ID
+)
+from utils import load_training_matrix
+from embedding_cache import image_cache_key, text_cache_key, embed_with_cache
+from inference_cache import pdf_cache_key, load_cached_inference, save_cached_inference
 
 
+log = logging.getLogger(__name__)
+
 SIMILARITY_THRESHOLD = 0.95
 
+# Image similarity is at most 1, so a combined score of 0.7 * image + 0.3 * text
+# can only clear SIMILARITY_THRESHOLD when text similarity reaches this bound.
+# Float16 storage of the training matrices can put image similarity slightly
+# above 1, so the bound is loosened by a margin well beyond that error
+MIN_TEXT_SIMILARITY = (SIMILARITY_THRESHOLD - 0.7) / 0.3 - 0.01
 
-def find_first_pages(
-    composite_pdf_path: str, 
-    embeddings_path: str = None,
+# Number of split documents written concurrently
+SPLIT_WRITE_WORKERS = 4
+
+
+def _preprocess_page(page_image: Image.Image) -> Image.Image:
+    """Detect the content area of a page and crop to it."""
+    bbox = detect_content_area(page_image)
+    return crop_to_content(page_image, bbox)
+
+
+def _render_pages(pdf: PdfContext, page_indices: np.ndarray) -> List[Image.Image]:
+    """
+    Render only the given pages, one render call per contiguous run.
+    
+    Args:
+        pdf: Open composite PDF
+        page_indices: Sorted zero-indexed page numbers to render
+    
+    Returns:
+        List of PIL Images in the order of page_indices
+    """
+    images = []
+    # Split the sorted indices wherever consecutive pages are not adjacent
+    runs = np.split(page_indices, np.flatnonzero(np.diff(page_indices) != 1) + 1)
+    for run in runs:
+        if run.size:
+            images.extend(pdf.get_images(int(run[0]), int(run[-1]) + 1))
+    return images
+
+
+def _embed_pages(
+    pdf: PdfContext,
+    total_pages: int,
+    train_txt: np.ndarray,
     progress_callback: Optional[Callable] = None
-) -> Tuple[List[int], Dict[int, Dict]]:
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
     """
-    Identify first pages in a composite PDF by comparing embeddings.
+    Embed the text of every page and the images of the pages that can match.
+    
+    Text is embedded first. A page can only clear the threshold if some
+    training doc's text similarity reaches MIN_TEXT_SIMILARITY, so every
+    other page is decided without being rasterized.
     
     Args:
-        composite_pdf_path: Path to composite PDF file
-        embeddings_path: Path to embeddings JSON file
+        pdf: Open composite PDF
+        total_pages: Number of pages in the PDF
+        train_txt: Training text embedding matrix
     
     Returns:
-        Tuple of (list of page indices, dict of page_idx -> similarity info)
+        Tuple of (text embeddings of every page, indices of the rendered
+        pages, image embeddings of those pages)
     """
-    # Load training embeddings
-    if embeddings_path is None:
-        from utils import get_backend_dir
-        embeddings_path = os.path.join(get_backend_dir(), "data", "embeddings.json")
+    if progress_callback:
+        progress_callback(status="loading", message="Extracting text...")
     
-    training_embeddings = load_embeddings(embeddings_path)
+    page_texts = pdf.get_texts()
+    # Pad text list so every page has an entry (pages without a text layer)
+    page_texts = [page_texts[i] if i < len(page_texts) else "" for i in range(total_pages)]
     
-    if not training_embeddings:
-        raise ValueError("No training embeddings found. Please train the model first.")
+    if progress_callback:
+        progress_callback(
+            status="processing",
+            total_pages=total_pages,
+            message=f"Generating text embeddings for {total_pages} pages..."
+        )
+    page_txt_embs = embed_with_cache(page_texts, text_cache_key, generate_text_embeddings_batch, TEXT_ENCODER_ID)
+    
+    txt_sims = cosine_similarity_matrix(page_txt_embs, train_txt)
+    image_pages = np.flatnonzero((txt_sims >= MIN_TEXT_SIMILARITY).any(axis=1))
+    log.debug("Rendering %d of %d pages that pass the text prefilter", image_pages.size, total_pages)
     
-    # Convert PDF to images and extract text
     if progress_callback:
-        progress_callback(status="loading", message="Converting PDF to images...")
+        progress_callback(
+            status="processing",
+            total_pages=total_pages,
+            message=f"Converting {image_pages.size} candidate pages to images..."
+        )
+    page_images = _render_pages(pdf, image_pages)
     
-    page_images = pdf_to_images(composite_pdf_path)
-    page_texts = extract_text_from_pdf(composite_pdf_path)
-    total_pages = len(page_images)
+    # Content detection and cropping. OpenCV releases the GIL, so pages are
+    # preprocessed concurrently on a thread pool.
+    cropped_images = []
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+        for page_idx, cropped_image in zip(image_pages, executor.map(_preprocess_page, page_images)):
+            cropped_images.append(cropped_image)
+            if progress_callback:
+                progress_callback(
+                    status="processing",
+                    current_page=int(page_idx) + 1,
+                    total_pages=total_pages,
+                    message=f"Analyzing page {page_idx + 1} of {total_pages}..."
+                )
     
+    # Batched image embeddings for all rendered pages at once
     if progress_callback:
         progress_callback(
             status="processing",
             total_pages=total_pages,
-            message=f"Processing {total_pages} pages..."
+            message=f"Generating image embeddings for {len(cropped_images)} pages..."
         )
+    page_img_embs = embed_with_cache(
+        cropped_images, image_cache_key, generate_image_embeddings_batch, get_image_encoder_id()
+    )
     
-    first_pages = []
-    similarity_info = {}  # Store similarity scores for each page
+    return page_txt_embs, image_pages, page_img_embs
+
+
+def find_first_pages(
+    composite_pdf_path: str, 
+    embeddings_path: str = None,
+    progress_callback: Optional[Callable] = None,
+    pdf: Optional[PdfContext] = None
+) -> Tuple[List[int], Dict[int, Dict], PdfReader]:
+    """
+    Identify first pages in a composite PDF by comparing embeddings.
+    
+    Args:
+        composite_pdf_path: Path to composite PDF file
+        embeddings_path: Path to embeddings JSONL file
+        pdf: Already-open PdfContext for the composite PDF (opened here if None)
     
-    # Process each page
-    for page_idx in range(len(page_images)):
+    Returns:
+        Tuple of (list of page indices, dict of page_idx -> similarity info,
+        PdfReader for the composite PDF so callers don't parse it again)
+    """
+    if pdf is None:
+        with PdfContext(composite_pdf_path) as pdf:
+            return find_first_pages(composite_pdf_path, embeddings_path, progress_callback, pdf)
+    
+    # Row-normalized float32 training matrices (memory-mapped from cache);
+    # load_training_matrix resolves the default embeddings path
+    train_img, train_txt, filenames = load_training_matrix(embeddings_path)
+    
+    if not filenames:
+        raise ValueError("No training embeddings found. Please train the model first.")
+    
+    # Parse the PDF structure once; split_composite_pdf reuses this reader
+    reader = PdfReader(composite_pdf_path)
+    total_pages = len(reader.pages)
+    
+    # Re-uploads of the same PDF against unchanged training data reuse the
+    # stored page embeddings and skip rendering and embedding entirely
+    cache_key = pdf_cache_key(
+        composite_pdf_path, train_img, train_txt, filenames,
+        MIN_TEXT_SIMILARITY, get_image_encoder_id(), pdf.dpi
+    )
+    cached = load_cached_inference(cache_key)
+    if cached is not None:
+        page_txt_embs = cached["txt_embs"]
+        image_pages = cached["image_pages"]
+        page_img_embs = cached["img_embs"]
+        log.debug("Inference cache hit for %s", composite_pdf_path)
         if progress_callback:
             progress_callback(
                 status="processing",
-                current_page=page_idx + 1,
                 total_pages=total_pages,
-                message=f"Analyzing page {page_idx + 1} of {total_pages}..."
+                message=f"Reusing cached embeddings for {total_pages} pages..."
             )
-        page_image = page_images[page_idx]
-        
-        # Detect content area and crop
-        bbox = detect_content_area(page_image)
-        cropped_image = crop_to_content(page_image, bbox)
-        
-        # Generate embeddings for this page
-        page_image_embedding = generate_image_embedding(cropped_image)
-        page_text = page_texts[page_idx] if page_idx < len(page_texts) else ""
-        page_text_embedding = generate_text_embedding(page_text)
-        
-        # Compare with training embeddings
+    else:
+        page_txt_embs, image_pages, page_img_embs = _embed_pages(pdf, total_pages, train_txt, progress_callback)
+        save_cached_inference(cache_key, page_txt_embs, image_pages, page_img_embs)
+    
+    # Cosine similarity of every page against every training doc is one
+    # pairwise call per modality (N x T score grids).
+    # Pages skipped by the text prefilter keep an image similarity of zero.
+    txt_sims = cosine_similarity_matrix(page_txt_embs, train_txt)
+    img_sims = np.zeros_like(txt_sims)
+    if image_pages.size:
+        img_sims[image_pages] = cosine_similarity_matrix(page_img_embs, train_img)
+    # Only training docs whose image similarity clears the threshold are candidates
+    candidate_mask = img_sims > SIMILARITY_THRESHOLD
+    has_candidates = candidate_mask.any(axis=1)
+    
+    combined = np.where(candidate_mask, (img_sims * 0.7) + (txt_sims * 0.3), 0.0)  # Weighted combination
+    best_scores = combined.max(axis=1)
+    first_pages = np.flatnonzero(has_candidates & (best_scores > SIMILARITY_THRESHOLD)).tolist()
+    
+    similarity_info = {}  # Store similarity scores for each page
+    debug_enabled = log.isEnabledFor(logging.DEBUG)
+    # Pages the text prefilter ruled out were never rendered, so they have
+    # no image scores; their entries are flagged rather than left ambiguous
+    prefiltered = np.ones(total_pages, dtype=bool)
+    prefiltered[image_pages] = False
+    
+    # Phase 3: record match details for each page
+    for page_idx in range(total_pages):
         best_match = None
-        best_similarity = 0.0
-        matches = []
-        
-        for filename, training_data in training_embeddings.items():
-            train_image_emb = training_data["image_embedding"]
-            train_text_emb = training_data["text_embedding"]
-            
-            # Calculate image similarity
-            image_sim = cosine_similarity(page_image_embedding, train_image_emb)
-            
-            if image_sim > SIMILARITY_THRESHOLD:
-                # Calculate text similarity for disambiguation
-                text_sim = cosine_similarity(page_text_embedding, train_text_emb)
-                matches.append({
-                    "filename": filename,
-                    "image_similarity": image_sim,
-                    "text_similarity": text_sim,
-                    "combined_score": (image_sim * 0.7) + (text_sim * 0.3)  # Weighted combination
-                })
+        # Candidates in descending combined-score order; the first is the best match
+        candidates = np.flatnonzero(candidate_mask[page_idx])
+        candidates = candidates[np.argsort(-combined[page_idx, candidates], kind="stable")]
+        matches = [
+            {
+                "filename": filenames[train_idx],
+                "image_similarity": float(img_sims[page_idx, train_idx]),
+                "text_similarity": float(txt_sims[page_idx, train_idx]),
+                "combined_score": float(combined[page_idx, train_idx])
+            }
+            for train_idx in candidates
+        ]
         
         # Store similarity info for this page (even if no match)
         if matches:
-            # Sort by combined score
-            matches.sort(key=lambda x: x["combined_score"], reverse=True)
             best_match = matches[0]
             
             # Log similarity scores for debugging
-            print(f"Page {page_idx + 1}: Best match = {best_match['filename']}")
-            print(f"  Image similarity: {best_match['image_similarity']:.4f} ({best_match['image_similarity']*100:.2f}%)")
-            print(f"  Text similarity: {best_match['text_similarity']:.4f} ({best_match['text_similarity']*100:.2f}%)")
-            print(f"  Combined score: {best_match['combined_score']:.4f} ({best_match['combined_score']*100:.2f}%)")
-            print(f"  Threshold: {SIMILARITY_THRESHOLD:.4f} ({SIMILARITY_THRESHOLD*100:.2f}%)")
+            if debug_enabled:
+                log.debug(
+                    "Page %d: Best match = %s (image %.4f, text %.4f, combined %.4f, threshold %.4f)",
+                    page_idx + 1,
+                    best_match["filename"],
+                    best_match["image_similarity"],
+                    best_match["text_similarity"],
+                    best_match["combined_score"],
+                    SIMILARITY_THRESHOLD
+                )
             
             # Store similarity info
             similarity_info[page_idx] = {
@@ -126,8 +261,8 @@ def find_first_pages(
             }
             
             if best_match["combined_score"] > SIMILARITY_THRESHOLD:
-                print(f"  ✓ MATCHED - Page {page_idx + 1} identified as first page")
-                first_pages.append(page_idx)
+                if debug_enabled:
+                    log.debug("Page %d: MATCHED - identified as first page", page_idx + 1)
                 
                 # Notify progress callback
                 if progress_callback:
@@ -148,7 +283,8 @@ def find_first_pages(
                         }
                     )
             else:
-                print(f"  ✗ NOT MATCHED - Score below threshold")
+                if debug_enabled:
+                    log.debug("Page %d: NOT MATCHED - score below threshold", page_idx + 1)
                 # Still notify progress callback for non-matched pages
                 if progress_callback:
                     progress_callback(
@@ -163,14 +299,16 @@ def find_first_pages(
                     )
         else:
             # No matches found, but store info anyway
-            print(f"Page {page_idx + 1}: No matches found (all below threshold)")
+            if debug_enabled:
+                log.debug("Page %d: No matches found (all below threshold)", page_idx + 1)
             similarity_info[page_idx] = {
                 "matched": False,
                 "best_match": None,
                 "image_similarity": 0.0,
                 "text_similarity": 0.0,
                 "combined_score": 0.0,
-                "all_matches": []
+                "all_matches": [],
+                "prefiltered": bool(prefiltered[page_idx])
             }
             
             # Notify progress callback for pages with no matches
@@ -182,11 +320,60 @@ def find_first_pages(
                     page_info={
                         "page": page_idx + 1,
                         "matched": False,
-                        "best_match": None
+                        "best_match": None,
+                        "prefiltered": bool(prefiltered[page_idx])
                     }
                 )
     
-    return first_pages, similarity_info
+    return first_pages, similarity_info, reader
+
+
+def _write_split(
+    reader: PdfReader,
+    reader_lock: threading.Lock,
+    doc_index: int,
+    start_page: int,
+    end_page: int,
+    output_path: str
+):
+    """
+    Write pages [start_page, end_page) of the composite PDF to a new file.
+    
+    Args:
+        reader: Reader for the composite PDF, shared between threads
+        reader_lock: Lock serializing access to the shared reader
+        doc_index: Zero-indexed document number (for logging)
+        start_page: First page to include (0-indexed)
+        end_page: Page after the last page to include (0-indexed)
+        output_path: Path to write the split PDF to
+    """
+    # Create new PDF writer for each split document
+    writer = PdfWriter()
+    
+    log.debug(
+        "Creating document %d from pages %d-%d (0-indexed, end exclusive)",
+        doc_index + 1, start_page, end_page
+    )
+    
+    # Add only the specific pages we want (from start to end) in one call,
+    # which also shares fonts/images common to those pages in the output.
+    # Don't use clone_reader_document_root as it may include all pages
+    # The reader lazily seeks its shared file stream while pages are cloned
+    # into the writer, so only that step is serialized
+    with reader_lock:
+        writer.append(reader, pages=(start_page, end_page), import_outline=False)
+    
+    # Verify we have the correct number of pages
+    expected_pages = end_page - start_page
+    actual_pages = len(writer.pages)
+    log.debug("Document %d has %d pages (expected %d)", doc_index + 1, actual_pages, expected_pages)
+    
+    if actual_pages != expected_pages:
+        log.error("Page count mismatch in document %d: %d pages, expected %d", doc_index + 1, actual_pages, expected_pages)
+    
+    # Save split PDF
+    with open(output_path, 'wb') as output_file:
+        writer.write(output_file)
 
 
 def split_composite_pdf(
@@ -201,20 +388,20 @@ def split_composite_pdf(
     Args:
         composite_pdf_path: Path to composite PDF file
         output_dir: Directory to save split PDFs
-        embeddings_path: Path to embeddings JSON file
+        embeddings_path: Path to embeddings JSONL file
     
     Returns:
         Tuple of (list of split documents, similarity info dict)
     """
     # Find first pages
-    if embeddings_path is None:
-        from utils import get_backend_dir
-        embeddings_path = os.path.join(get_backend_dir(), "data", "embeddings.json")
-    
     if progress_callback:
         progress_callback(status="analyzing", message="Identifying document boundaries...")
     
-    first_pages, similarity_info = find_first_pages(composite_pdf_path, embeddings_path, progress_callback)
+    # Text extraction and rendering share one open handle on the PDF
+    with PdfContext(composite_pdf_path) as pdf:
+        first_pages, similarity_info, reader = find_first_pages(
+            composite_pdf_path, embeddings_path, progress_callback, pdf
+        )
     
     if not first_pages:
         raise ValueError("No first pages identified. Cannot split PDF.")
@@ -222,63 +409,56 @@ def split_composite_pdf(
     # Ensure output directory exists
     os.makedirs(output_dir, exist_ok=True)
     
-    # Read composite PDF
-    reader = PdfReader(composite_pdf_path)
+    # Reuse the reader opened while finding first pages
     total_pages = len(reader.pages)
     
     # Add end marker (total pages) to simplify splitting logic
     first_pages.append(total_pages)
     
     split_documents = []
+    num_documents = len(first_pages) - 1
     
     if progress_callback:
         progress_callback(
             status="splitting",
-            message=f"Creating {len(first_pages) - 1} individual documents..."
+            message=f"Creating {num_documents} individual documents..."
         )
     
-    # Split PDF at identified boundaries
-    for i in range(len(first_pages) - 1):
-        if progress_callback:
-            progress_callback(
-                status="splitting",
-                message=f"Generating document {i + 1} of {len(first_pages) - 1}..."
+    # Precompute each document's (start, end, output path) once for both the
+    # writers and the result metadata
+    base_name = os.path.splitext(os.path.basename(composite_pdf_path))[0]
+    splits = [
+        (
+            first_pages[i],
+            first_pages[i + 1],
+            f"{base_name}_document_{i + 1}.pdf"
+        )
+        for i in range(num_documents)
+    ]
+    
+    # Split PDF at identified boundaries; documents are independent, so they
+    # are built and written concurrently
+    reader_lock = threading.Lock()
+    with ThreadPoolExecutor(max_workers=min(SPLIT_WRITE_WORKERS, num_documents)) as executor:
+        futures = [
+            executor.submit(
+                _write_split, reader, reader_lock, i, start_page, end_page, os.path.join(output_dir, output_filename)
             )
-        start_page = first_pages[i]
-        end_page = first_pages[i + 1]
-        
-        # Create new PDF writer for each split document
-        writer = PdfWriter()
-        
-        # Add only the specific pages we want (from start to end)
-        # Don't use clone_reader_document_root as it may include all pages
-        print(f"\nCreating Document {i + 1}:")
-        print(f"  Start page (0-indexed): {start_page}")
-        print(f"  End page (0-indexed): {end_page}")
-        print(f"  Pages to include: {list(range(start_page, end_page))}")
-        
-        for page_num in range(start_page, end_page):
-            page = reader.pages[page_num]
-            writer.add_page(page)
-            print(f"  Added page {page_num + 1} (index {page_num})")
-        
-        # Verify we have the correct number of pages
-        expected_pages = end_page - start_page
-        actual_pages = len(writer.pages)
-        print(f"  Result: {actual_pages} pages in document (expected {expected_pages})")
+            for i, (start_page, end_page, output_filename) in enumerate(splits)
+        ]
         
-        if actual_pages != expected_pages:
-            print(f"  ERROR: Page count mismatch!")
-        
-        # Generate output filename
-        base_name = os.path.splitext(os.path.basename(composite_pdf_path))[0]
-        output_filename = f"{base_name}_document_{i + 1}.pdf"
+        for completed, future in enumerate(as_completed(futures), start=1):
+            future.result()
+            if progress_callback:
+                progress_callback(
+                    status="splitting",
+                    message=f"Generated document {completed} of {num_documents}..."
+                )
+    
+    # Build results in document order
+    for start_page, end_page, output_filename in splits:
         output_path = os.path.join(output_dir, output_filename)
         
-        # Save split PDF
-        with open(output_path, 'wb') as output_file:
-            writer.write(output_file)
-        
         # Get similarity info for the first page of this document
         page_similarity = similarity_info.get(start_page, {})
         
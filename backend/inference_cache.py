@@ -0,0 +1,125 @@
+"""Disk cache for per-PDF inference embeddings keyed by PDF content and training data."""
+import hashlib
+import logging
+import os
+from typing import Dict, List, Optional
+import numpy as np
+from utils import get_backend_dir, ensure_directory, prune_oldest_files
+
+
+log = logging.getLogger(__name__)
+
+# Cached PDFs kept on disk; the oldest written are pruned beyond this.
+# Every retrain changes the key of every PDF, orphaning earlier entries
+MAX_CACHE_ENTRIES = int(os.getenv("INFERENCE_CACHE_MAX_ENTRIES", 200))
+
+
+def get_cache_dir() -> str:
+    """Get the directory holding cached inference results."""
+    return os.path.join(get_backend_dir(), "data", "inference_cache")
+
+
+def pdf_cache_key(
+    pdf_path: str,
+    train_img: np.ndarray,
+    train_txt: np.ndarray,
+    filenames: List[str],
+    min_text_similarity: float,
+    image_encoder_id: str,
+    render_dpi: int
+) -> str:
+    """
+    Compute the cache key for a composite PDF.
+
+    The training matrices, text prefilter bound, image encoder and render
+    resolution are part of the key, so entries are invalidated whenever a
+    training document is added or replaced, or the rendered pages or their
+    embeddings would change.
+
+    Args:
+        pdf_path: Path to the composite PDF
+        train_img: Training image embedding matrix
+        train_txt: Training text embedding matrix
+        filenames: Training document names, in matrix row order
+        min_text_similarity: Text prefilter bound deciding which pages are rendered
+        image_encoder_id: Encoder producing the page image embeddings
+            (embeddings.get_image_encoder_id())
+        render_dpi: Resolution the pages are rendered at
+
+    Returns:
+        Key identifying the PDF content and training state
+    """
+    pdf_digest = hashlib.blake2b()
+    with open(pdf_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            pdf_digest.update(chunk)
+
+    training_digest = hashlib.blake2b(digest_size=16)
+    training_digest.update("\0".join(filenames).encode('utf-8'))
+    training_digest.update(repr(min_text_similarity).encode('ascii'))
+    training_digest.update(f"\0{image_encoder_id}\0{render_dpi}".encode('utf-8'))
+    training_digest.update(np.ascontiguousarray(train_img).tobytes())
+    training_digest.update(np.ascontiguousarray(train_txt).tobytes())
+
+    return f"{pdf_digest.hexdigest()}-{training_digest.hexdigest()}"
+
+
+def load_cached_inference(key: str) -> Optional[Dict[str, np.ndarray]]:
+    """
+    Look up cached embeddings for a composite PDF.
+
+    Args:
+        key: Cache key from pdf_cache_key
+
+    Returns:
+        Dict with 'txt_embs', 'image_pages' and 'img_embs' arrays, or None on a miss
+    """
+    path = os.path.join(get_cache_dir(), f"{key}.npz")
+    if not os.path.exists(path):
+        return None
+
+    try:
+        with np.load(path) as data:
+            return {name: data[name] for name in ("txt_embs", "image_pages", "img_embs")}
+    except Exception as e:
+        # Treat unreadable entries as misses; they are overwritten on save
+        log.warning("Ignoring corrupt inference cache entry %s: %s", path, e)
+        return None
+
+
+def save_cached_inference(key: str, txt_embs: np.ndarray, image_pages: np.ndarray, img_embs: np.ndarray):
+    """
+    Store embeddings for a composite PDF.
+
+    Args:
+        key: Cache key from pdf_cache_key
+        txt_embs: Text embeddings of every page, shape (N, D)
+        image_pages: Indices of the pages that were rendered
+        img_embs: Image embeddings of the pages in image_pages
+    """
+    cache_dir = get_cache_dir()
+    ensure_directory(cache_dir)
+
+    path = os.path.join(cache_dir, f"{key}.npz")
+    tmp_path = f"{path}.tmp"
+
+    # Write to a temp file and rename so readers never see a partial entry
+    with open(tmp_path, 'wb') as f:
+        np.savez_compressed(f, txt_embs=txt_embs, image_pages=image_pages, img_embs=img_embs)
+    os.replace(tmp_path, path)
+
+    prune_cache(MAX_CACHE_ENTRIES)
+
+
+def prune_cache(max_entries: int = MAX_CACHE_ENTRIES) -> int:
+    """
+    Delete the oldest written entries beyond max_entries.
+
+    Args:
+        max_entries: Number of entries to keep
+
+    Returns:
+        Number of entries left on disk
+    """
+    remaining, _ = prune_oldest_files(get_cache_dir(), ".npz", max_entries)
+    return remaining
@@ -1,9 +1,9 @@
 """FastAPI application for PDF document splitting."""
 import os
 import sys
-import shutil
-from pathlib import Path
+import logging
 from typing import List
+from urllib.parse import quote
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
@@ -11,18 +11,25 @@ backend_dir = os.path.dirname(os.path.abspath(__file__))
 env_path = os.path.join(backend_dir, '.env')
 load_dotenv(env_path)
 
+# Configure logging (set LOG_LEVEL=DEBUG for per-page similarity details)
+logging.basicConfig(
+    level=os.getenv("LOG_LEVEL", "INFO").upper(),
+    format="%(asctime)s %(levelname)s %(name)s: %(message)s"
+)
+
 # Add backend directory to path for imports
 if backend_dir not in sys.path:
     sys.path.insert(0, backend_dir)
 
-from fastapi import FastAPI, UploadFile, File, HTTPException, BackgroundTasks
+from fastapi import FastAPI, UploadFile, File, HTTPException, BackgroundTasks, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
+from fastapi.responses import FileResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 import uvicorn
-from training import process_training_document, get_training_pipeline_preview
+from training import process_training_document, process_training_documents_batch, get_training_pipeline_preview
 from inference import split_composite_pdf
-from utils import ensure_directory, load_embeddings
+from embeddings import warmup
+from utils import ensure_directory, load_embeddings, has_training_data
 from progress_tracker import ProgressTracker
 from PIL import Image
 import io
@@ -30,6 +37,7 @@ import base64
 import json
 import asyncio
 import threading
+import aiofiles
 
 app = FastAPI(title="PDF Document Splitter API")
 
@@ -48,19 +56,49 @@ uploads_training = os.path.join(backend_dir, "uploads", "training")
 uploads_inference = os.path.join(backend_dir, "uploads", "inference")
 outputs_dir = os.path.join(backend_dir, "outputs")
 data_dir = os.path.join(backend_dir, "data")
+previews_dir = os.path.join(data_dir, "training_previews")
 
 ensure_directory(uploads_training)
 ensure_directory(uploads_inference)
 ensure_directory(outputs_dir)
 ensure_directory(data_dir)
+ensure_directory(previews_dir)
+
+# Uploads are streamed to disk in chunks of this many bytes
+UPLOAD_CHUNK_SIZE = 1 << 20
+
+# Saved training previews are served as static files instead of inlined base64
+app.mount("/previews", StaticFiles(directory=previews_dir), name="previews")
+
+
+@app.on_event("startup")
+async def warmup_models():
+    """Load embedding models before serving so the first request isn't blocked."""
+    if os.getenv("WARMUP_MODELS", "1") != "0":
+        await asyncio.to_thread(warmup)
 
 
 def image_to_base64(image: Image.Image) -> str:
     """Convert PIL Image to base64 string."""
     buffered = io.BytesIO()
-    image.save(buffered, format="PNG")
+    # WebP at method 0 encodes several times faster than PNG and is smaller
+    image.save(buffered, format="WEBP", quality=85, method=0)
     img_str = base64.b64encode(buffered.getvalue()).decode()
-    return f"data:image/png;base64,{img_str}"
+    return f"data:image/webp;base64,{img_str}"
+
+
+def preview_url(image_path: str) -> str:
+    """Get the static URL of a saved training preview image."""
+    # The mtime busts browser caches when a document is retrained under the same name
+    version = int(os.path.getmtime(image_path))
+    return f"/previews/{quote(os.path.basename(image_path))}?v={version}"
+
+
+async def save_upload(file: UploadFile, upload_path: str):
+    """Write an uploaded file to disk in chunks without blocking the event loop."""
+    async with aiofiles.open(upload_path, "wb") as buffer:
+        while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+            await buffer.write(chunk)
 
 
 @app.get("/")
@@ -81,28 +119,61 @@ async def train_model(file: UploadFile = File(...)):
     upload_path = os.path.join(uploads_training, file.filename)
     ensure_directory(os.path.dirname(upload_path))
     
-    with open(upload_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    await save_upload(file, upload_path)
     
     try:
         # Process training document
-        result = process_training_document(upload_path, file.filename)
-        
-        # Convert images to base64 for frontend
-        original_b64 = image_to_base64(result["original_image"])
-        cropped_b64 = image_to_base64(result["cropped_image"])
+        result = await asyncio.to_thread(process_training_document, upload_path, file.filename)
         
+        # The previews were already saved during training; link to them
         return {
             "status": "success",
             "filename": result["filename"],
             "bbox": result["bbox"],
-            "original_image": original_b64,
-            "cropped_image": cropped_b64
+            "original_image": preview_url(result["original_image_path"]),
+            "cropped_image": preview_url(result["cropped_image_path"])
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error processing training document: {str(e)}")
 
 
+@app.post("/api/train/batch")
+async def train_model_batch(files: List[UploadFile] = File(...)):
+    """
+    Upload several individual documents for training in one request.
+    Embeddings are generated in one batch; returns pipeline visualization data per document.
+    """
+    for file in files:
+        if not file.filename.endswith('.pdf'):
+            raise HTTPException(status_code=400, detail=f"File must be a PDF: {file.filename}")
+    
+    # Save uploaded files
+    documents = []
+    for file in files:
+        upload_path = os.path.join(uploads_training, file.filename)
+        ensure_directory(os.path.dirname(upload_path))
+        await save_upload(file, upload_path)
+        documents.append((upload_path, file.filename))
+    
+    try:
+        results = await asyncio.to_thread(process_training_documents_batch, documents)
+        
+        return {
+            "status": "success",
+            "documents": [
+                {
+                    "filename": result["filename"],
+                    "bbox": result["bbox"],
+                    "original_image": preview_url(result["original_image_path"]),
+                    "cropped_image": preview_url(result["cropped_image_path"])
+                }
+                for result in results
+            ]
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error processing training documents: {str(e)}")
+
+
 def process_inference_sync(job_id: str, upload_path: str, output_dir: str):
     """Synchronous wrapper for inference processing."""
     try:
@@ -141,6 +212,10 @@ async def run_inference(file: UploadFile = File(...), background_tasks: Backgrou
     if not file.filename.endswith('.pdf'):
         raise HTTPException(status_code=400, detail="File must be a PDF")
     
+    # Fail before the upload is saved and a job started if there is nothing to match against
+    if not has_training_data():
+        raise HTTPException(status_code=400, detail="No training embeddings found. Please train the model first.")
+    
     # Create progress tracking job
     job_id = ProgressTracker.create_job()
     
@@ -148,8 +223,7 @@ async def run_inference(file: UploadFile = File(...), background_tasks: Backgrou
     upload_path = os.path.join(uploads_inference, file.filename)
     ensure_directory(os.path.dirname(upload_path))
     
-    with open(upload_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    await save_upload(file, upload_path)
     
     # Run inference in background thread (since it's CPU-bound)
     thread = threading.Thread(
@@ -175,6 +249,38 @@ async def get_inference_progress(job_id: str):
     return progress
 
 
+@app.get("/api/inference/progress/{job_id}/stream")
+async def stream_inference_progress(job_id: str, request: Request):
+    """
+    Stream progress for an inference job as server-sent events.
+    An event is pushed on every change until the job completes or fails,
+    or the client disconnects.
+    """
+    if not ProgressTracker.get_progress(job_id):
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    async def event_stream():
+        version = -1
+        while not await request.is_disconnected():
+            new_version, progress = await ProgressTracker.wait_for_update(job_id, version)
+            if progress is None:
+                break
+            if new_version == version:
+                # Nothing changed before the timeout; keep the connection alive
+                yield ": keepalive\n\n"
+                continue
+            version = new_version
+            yield f"data: {json.dumps(progress)}\n\n"
+            if progress["status"] in ("completed", "failed"):
+                break
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"}
+    )
+
+
 @app.get("/api/download/{filename}")
 async def download_file(filename: str):
     """
@@ -238,19 +344,11 @@ async def get_training_preview(filename: str):
     if not os.path.exists(original_path) or not os.path.exists(cropped_path):
         raise HTTPException(status_code=404, detail="Preview image files not found")
     
-    # Load and convert images to base64
-    from PIL import Image
-    original_img = Image.open(original_path)
-    cropped_img = Image.open(cropped_path)
-    
-    original_b64 = image_to_base64(original_img)
-    cropped_b64 = image_to_base64(cropped_img)
-    
     return {
         "filename": filename,
         "bbox": doc_data.get("bbox"),
-        "original_image": original_b64,
-        "cropped_image": cropped_b64
+        "original_image": preview_url(original_path),
+        "cropped_image": preview_url(cropped_path)
     }
 
 
@@ -267,12 +365,11 @@ async def preview_pipeline(file: UploadFile = File(...)):
     upload_path = os.path.join(uploads_training, f"preview_{file.filename}")
     ensure_directory(os.path.dirname(upload_path))
     
-    with open(upload_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    await save_upload(file, upload_path)
     
     try:
         # Get pipeline preview
-        preview = get_training_pipeline_preview(upload_path)
+        preview = await asyncio.to_thread(get_training_pipeline_preview, upload_path)
         
         # Convert images to base64
         original_b64 = image_to_base64(preview["original_image"])
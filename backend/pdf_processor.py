@@ -1,74 +1,189 @@
 """PDF processing utilities for converting PDFs to images and extracting text."""
-import io
 import os
-from typing import List, Tuple
+import threading
+from typing import List, Optional
 from pdf2image import convert_from_path
 import pdfplumber
 from PIL import Image
+# Render in-process with PDFium if available, fallback to Poppler subprocesses
+try:
+    import pypdfium2 as pdfium
+    USE_PDFIUM = True
+except ImportError:
+    USE_PDFIUM = False
 
 # Poppler path - update this if your Poppler is installed elsewhere
 POPPLER_PATH = r"C:\Program Files\poppler\poppler-25.11.0\Library\bin"
 
+# Upper bound on pdftoppm processes used to render one PDF
+MAX_RENDER_PROCESSES = 6
 
-def pdf_to_images(pdf_path: str, dpi: int = 200) -> List[Image.Image]:
+# CLIP downsamples pages to 224px, so 150 DPI yields the same embeddings as
+# higher resolutions at a fraction of the render time and memory
+DEFAULT_RENDER_DPI = int(os.getenv("RENDER_DPI", 150))
+
+# PDFium is not thread-safe, even across separate documents, so every call
+# into it takes this process-wide lock. Rendering through PDFium is therefore
+# sequential within a process; only the Poppler fallback renders in parallel
+_pdfium_lock = threading.Lock()
+
+
+def pdf_to_images(
+    pdf_path: str,
+    dpi: Optional[int] = None,
+    thread_count: Optional[int] = None,
+    first_page: Optional[int] = None,
+    last_page: Optional[int] = None
+) -> List[Image.Image]:
     """
     Convert PDF pages to PIL Images.
     
+    PDFium renders in-process and one page at a time (see _pdfium_lock);
+    without it, Poppler renders page ranges in parallel subprocesses.
+    
     Args:
         pdf_path: Path to PDF file
-        dpi: Resolution for image conversion (default: 200)
+        dpi: Resolution for image conversion (default: DEFAULT_RENDER_DPI)
+        thread_count: Number of Poppler processes rendering page ranges in
+            parallel when PDFium is unavailable (default: min(CPU count, 6))
+        first_page: First page to render, 1-indexed (default: first page)
+        last_page: Last page to render, 1-indexed and inclusive (default: last page)
     
     Returns:
-        List of PIL Images, one per page
+        List of PIL Images, one per rendered page
     """
+    if dpi is None:
+        dpi = DEFAULT_RENDER_DPI
+    if thread_count is None:
+        thread_count = min(os.cpu_count() or 1, MAX_RENDER_PROCESSES)
+    
+    if USE_PDFIUM:
+        return _render_with_pdfium(pdf_path, dpi, first_page, last_page)
+    
     try:
         # Use Poppler path if it exists, otherwise rely on PATH
         poppler_path = POPPLER_PATH if os.path.exists(POPPLER_PATH) else None
-        images = convert_from_path(pdf_path, dpi=dpi, poppler_path=poppler_path)
+        images = convert_from_path(
+            pdf_path,
+            dpi=dpi,
+            poppler_path=poppler_path,
+            thread_count=thread_count,
+            first_page=first_page,
+            last_page=last_page
+        )
         return images
     except Exception as e:
         raise Exception(f"Error converting PDF to images: {str(e)}")
 
 
-def extract_text_from_pdf(pdf_path: str) -> List[str]:
-    """
-    Extract text from each page of a PDF.
-    
-    Args:
-        pdf_path: Path to PDF file
-    
-    Returns:
-        List of text strings, one per page
-    """
-    texts = []
+def _render_pdfium_pages(pdf, dpi: int, start: int, end: int) -> List[Image.Image]:
+    """Render zero-indexed pages [start, end) of an open PDFium document."""
+    images = []
+    with _pdfium_lock:
+        for page_idx in range(start, min(end, len(pdf))):
+            # Render straight to RGB byte order so the page needs no
+            # convert() pass on top of the copy to_pil() makes
+            image = pdf[page_idx].render(scale=dpi / 72, rev_byteorder=True).to_pil()
+            if image.mode != "RGB":
+                image = image.convert("RGB")
+            images.append(image)
+    return images
+
+
+def _render_with_pdfium(
+    pdf_path: str,
+    dpi: int,
+    first_page: Optional[int],
+    last_page: Optional[int]
+) -> List[Image.Image]:
+    """Render a 1-indexed inclusive page range with PDFium, without spawning a subprocess."""
     try:
-        with pdfplumber.open(pdf_path) as pdf:
-            for page in pdf.pages:
-                text = page.extract_text() or ""
-                texts.append(text)
-        return texts
+        with _pdfium_lock:
+            pdf = pdfium.PdfDocument(pdf_path)
+        try:
+            start = (first_page or 1) - 1
+            end = last_page or len(pdf)
+            return _render_pdfium_pages(pdf, dpi, start, end)
+        finally:
+            with _pdfium_lock:
+                pdf.close()
     except Exception as e:
-        raise Exception(f"Error extracting text from PDF: {str(e)}")
+        raise Exception(f"Error converting PDF to images: {str(e)}")
 
 
-def extract_text_from_page(pdf_path: str, page_number: int) -> str:
+class PdfContext:
     """
-    Extract text from a specific page of a PDF.
+    A PDF opened once for both text extraction and rendering.
     
-    Args:
-        pdf_path: Path to PDF file
-        page_number: Zero-indexed page number
+    Use as a context manager; pages are zero-indexed:
     
-    Returns:
-        Text content of the page
+        with PdfContext(pdf_path) as pdf:
+            image = pdf.get_image(0)
+            text = pdf.get_text(0)
     """
-    try:
-        with pdfplumber.open(pdf_path) as pdf:
-            if page_number < len(pdf.pages):
-                text = pdf.pages[page_number].extract_text() or ""
-                return text
-            else:
-                raise ValueError(f"Page {page_number} does not exist in PDF")
-    except Exception as e:
-        raise Exception(f"Error extracting text from page: {str(e)}")
-
+    
+    def __init__(self, pdf_path: str, dpi: Optional[int] = None):
+        """
+        Args:
+            pdf_path: Path to PDF file
+            dpi: Resolution for rendered pages (default: DEFAULT_RENDER_DPI)
+        """
+        self.pdf_path = pdf_path
+        self.dpi = dpi if dpi is not None else DEFAULT_RENDER_DPI
+        self._plumber = None
+        self._pdfium = None
+    
+    def __enter__(self) -> "PdfContext":
+        try:
+            self._plumber = pdfplumber.open(self.pdf_path)
+            if USE_PDFIUM:
+                with _pdfium_lock:
+                    self._pdfium = pdfium.PdfDocument(self.pdf_path)
+        except Exception as e:
+            self.close()
+            raise Exception(f"Error opening PDF: {str(e)}")
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+    
+    def close(self):
+        """Close the underlying PDF handles."""
+        if self._plumber is not None:
+            self._plumber.close()
+            self._plumber = None
+        if self._pdfium is not None:
+            with _pdfium_lock:
+                self._pdfium.close()
+            self._pdfium = None
+    
+    def __len__(self) -> int:
+        return len(self._plumber.pages)
+    
+    def get_text(self, page_number: int) -> str:
+        """Extract the text of one page."""
+        if page_number >= len(self):
+            raise ValueError(f"Page {page_number} does not exist in PDF")
+        try:
+            return self._plumber.pages[page_number].extract_text() or ""
+        except Exception as e:
+            raise Exception(f"Error extracting text from page: {str(e)}")
+    
+    def get_texts(self) -> List[str]:
+        """Extract the text of every page."""
+        return [self.get_text(page_number) for page_number in range(len(self))]
+    
+    def get_image(self, page_number: int) -> Image.Image:
+        """Render one page."""
+        if page_number >= len(self):
+            raise ValueError(f"Page {page_number} does not exist in PDF")
+        return self.get_images(page_number, page_number + 1)[0]
+    
+    def get_images(self, start: int, end: int) -> List[Image.Image]:
+        """Render pages [start, end)."""
+        if self._pdfium is None:
+            return pdf_to_images(self.pdf_path, dpi=self.dpi, first_page=start + 1, last_page=end)
+        try:
+            return _render_pdfium_pages(self._pdfium, self.dpi, start, end)
+        except Exception as e:
+            raise Exception(f"Error converting PDF to images: {str(e)}")
@@ -1,13 +1,28 @@
 """Progress tracking for inference operations."""
-from typing import Dict, Optional
+import asyncio
+import logging
+import threading
+from typing import Dict, Optional, Set, Tuple
 import time
 import uuid
 
 
+log = logging.getLogger(__name__)
+
+
 class ProgressTracker:
     """Thread-safe progress tracker for inference operations."""
     
     _instances: Dict[str, Dict] = {}
+    # Each job has its own lock, so concurrent jobs don't contend
+    _locks: Dict[str, threading.Lock] = {}
+    # Incremented on every change to a job
+    _versions: Dict[str, int] = {}
+    # (event loop, event) pairs of streaming clients waiting for the next
+    # change; jobs run on worker threads, so events are set through their loop
+    _waiters: Dict[str, Set[Tuple[asyncio.AbstractEventLoop, asyncio.Event]]] = {}
+    # Guards adding and removing jobs
+    _registry_lock = threading.Lock()
     
     @classmethod
     def create_job(cls, job_id: Optional[str] = None) -> str:
@@ -15,7 +30,7 @@ class ProgressTracker:
         if job_id is None:
             job_id = str(uuid.uuid4())
         
-        cls._instances[job_id] = {
+        job = {
             "status": "initializing",
             "current_page": 0,
             "total_pages": 0,
@@ -26,6 +41,11 @@ class ProgressTracker:
             "start_time": time.time(),
             "error": None
         }
+        with cls._registry_lock:
+            cls._locks[job_id] = threading.Lock()
+            cls._versions[job_id] = 0
+            cls._waiters[job_id] = set()
+            cls._instances[job_id] = job
         return job_id
     
     @classmethod
@@ -40,12 +60,40 @@ class ProgressTracker:
         identified_document: Dict = None
     ):
         """Update progress for a job."""
-        if job_id not in cls._instances:
-            print(f"Warning: Job {job_id} not found in progress tracker")
+        job = cls._instances.get(job_id)
+        if job is None:
+            log.warning("Job %s not found in progress tracker", job_id)
             return
         
-        job = cls._instances[job_id]
+        with cls._locks[job_id]:
+            cls._apply_update(job, status, current_page, total_pages, message, page_info, identified_document)
+            cls._notify(job_id)
         
+        log.debug("Progress update for job %s: %s - %s (%d%%)", job_id, job["status"], job["message"], job["progress_percentage"])
+    
+    @classmethod
+    def _notify(cls, job_id: str):
+        """Record a change to a job and wake streaming clients (caller holds the job lock)."""
+        cls._versions[job_id] += 1
+        cls._wake_waiters(job_id)
+    
+    @classmethod
+    def _wake_waiters(cls, job_id: str):
+        """Set the event of every client waiting on a job (caller holds the job lock)."""
+        for loop, event in cls._waiters.get(job_id, ()):
+            loop.call_soon_threadsafe(event.set)
+    
+    @staticmethod
+    def _apply_update(
+        job: Dict,
+        status: Optional[str],
+        current_page: Optional[int],
+        total_pages: Optional[int],
+        message: Optional[str],
+        page_info: Optional[Dict],
+        identified_document: Optional[Dict]
+    ):
+        """Apply one progress update to a job dict (caller holds the job lock)."""
         if status:
             job["status"] = status
         if current_page is not None:
@@ -68,45 +116,114 @@ class ProgressTracker:
             job["progress_percentage"] = int((job["current_page"] / job["total_pages"]) * 100)
         else:
             job["progress_percentage"] = 0
-        
-        # Debug log
-        print(f"Progress update for job {job_id}: {job['status']} - {job['message']} ({job['progress_percentage']}%)")
     
     @classmethod
     def get_progress(cls, job_id: str) -> Optional[Dict]:
-        """Get current progress for a job."""
-        return cls._instances.get(job_id)
+        """Get a snapshot of the current progress for a job."""
+        job = cls._instances.get(job_id)
+        if job is None:
+            return None
+        
+        with cls._locks[job_id]:
+            return cls._snapshot(job)
+    
+    @classmethod
+    async def wait_for_update(cls, job_id: str, last_version: int, timeout: float = 5.0) -> Tuple[int, Optional[Dict]]:
+        """
+        Wait until a job changes after last_version, or the timeout expires.
+        
+        Waits on an asyncio event rather than blocking a thread, so an idle
+        streaming client holds no worker thread.
+        
+        Args:
+            job_id: Job to watch
+            last_version: Version returned by the previous call (-1 for the first)
+            timeout: Maximum number of seconds to wait
+        
+        Returns:
+            Tuple of (current version, progress snapshot); the snapshot is
+            None if the job does not exist
+        """
+        job = cls._instances.get(job_id)
+        lock = cls._locks.get(job_id)
+        if job is None or lock is None:
+            return last_version, None
+        
+        waiter = (asyncio.get_running_loop(), asyncio.Event())
+        with lock:
+            version = cls._versions.get(job_id)
+            if version is None:
+                return last_version, None
+            if version != last_version:
+                return version, cls._snapshot(job)
+            cls._waiters[job_id].add(waiter)
+        
+        try:
+            await asyncio.wait_for(waiter[1].wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with lock:
+                cls._waiters.get(job_id, set()).discard(waiter)
+        
+        with lock:
+            # The job may have been cleaned up while waiting
+            version = cls._versions.get(job_id)
+            if version is None:
+                return last_version, None
+            return version, cls._snapshot(job)
+    
+    @staticmethod
+    def _snapshot(job: Dict) -> Dict:
+        """Copy a job dict (caller holds the job lock)."""
+        # Copy the lists so the response isn't serialized while a worker appends
+        snapshot = dict(job)
+        snapshot["processed_pages"] = list(job["processed_pages"])
+        snapshot["identified_documents"] = list(job["identified_documents"])
+        return snapshot
     
     @classmethod
     def complete_job(cls, job_id: str, result: Dict = None):
         """Mark a job as complete."""
-        if job_id not in cls._instances:
+        job = cls._instances.get(job_id)
+        if job is None:
             return
         
-        job = cls._instances[job_id]
-        job["status"] = "completed"
-        job["progress_percentage"] = 100
-        job["message"] = "Processing complete!"
-        if result:
-            job["result"] = result
-        job["end_time"] = time.time()
-        job["duration"] = job["end_time"] - job["start_time"]
+        with cls._locks[job_id]:
+            job["status"] = "completed"
+            job["progress_percentage"] = 100
+            job["message"] = "Processing complete!"
+            if result:
+                job["result"] = result
+            job["end_time"] = time.time()
+            job["duration"] = job["end_time"] - job["start_time"]
+            cls._notify(job_id)
     
     @classmethod
     def fail_job(cls, job_id: str, error: str):
         """Mark a job as failed."""
-        if job_id not in cls._instances:
+        job = cls._instances.get(job_id)
+        if job is None:
             return
         
-        job = cls._instances[job_id]
-        job["status"] = "failed"
-        job["error"] = error
-        job["message"] = f"Error: {error}"
-        job["end_time"] = time.time()
-        job["duration"] = job["end_time"] - job["start_time"]
+        with cls._locks[job_id]:
+            job["status"] = "failed"
+            job["error"] = error
+            job["message"] = f"Error: {error}"
+            job["end_time"] = time.time()
+            job["duration"] = job["end_time"] - job["start_time"]
+            cls._notify(job_id)
     
     @classmethod
     def cleanup(cls, job_id: str):
         """Remove a job from tracking (optional cleanup)."""
-        cls._instances.pop(job_id, None)
+        with cls._registry_lock:
+            cls._instances.pop(job_id, None)
+            lock = cls._locks.pop(job_id, None)
+            cls._versions.pop(job_id, None)
+        if lock is not None:
+            # Wake streaming clients so they see the job is gone
+            with lock:
+                cls._wake_waiters(job_id)
+                cls._waiters.pop(job_id, None)
 
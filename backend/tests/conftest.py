@@ -0,0 +1,7 @@
+"""Make the flat backend modules importable from the tests."""
+import os
+import sys
+
+backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if backend_dir not in sys.path:
+    sys.path.insert(0, backend_dir)
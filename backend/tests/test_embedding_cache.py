@@ -0,0 +1,61 @@
+"""Tests for embedding_cache."""
+import numpy as np
+import pytest
+import embedding_cache
+from embedding_cache import embed_with_cache, prune_cache, text_cache_key
+
+
+@pytest.fixture(autouse=True)
+def isolated_cache(tmp_path, monkeypatch):
+    """Point the cache at a temp directory and start with an empty LRU."""
+    monkeypatch.setattr(embedding_cache, "get_cache_dir", lambda: str(tmp_path))
+    monkeypatch.setattr(embedding_cache, "_disk_entry_count", None)
+    embedding_cache._memory_cache.clear()
+    yield tmp_path
+    embedding_cache._memory_cache.clear()
+
+
+class FakeEncoder:
+    """Batch embedding function that records the items it was asked to embed."""
+
+    def __init__(self, offset=0.0):
+        self.offset = offset
+        self.calls = []
+
+    def __call__(self, texts):
+        self.calls.append(list(texts))
+        return np.array([[len(text) + 1.0, self.offset] for text in texts], dtype=np.float32).reshape(-1, 2)
+
+
+def test_cached_text_is_not_re_embedded():
+    encoder = FakeEncoder()
+    embed_with_cache(["alpha", "beta"], text_cache_key, encoder, "enc-a")
+    embed_with_cache(["alpha", "beta", "alpha"], text_cache_key, encoder, "enc-a")
+    assert encoder.calls == [["alpha", "beta"], []]
+
+
+def test_entries_are_keyed_by_encoder():
+    old_encoder, new_encoder = FakeEncoder(0.0), FakeEncoder(5.0)
+    old = embed_with_cache(["alpha"], text_cache_key, old_encoder, "enc-a")
+    new = embed_with_cache(["alpha"], text_cache_key, new_encoder, "enc-b")
+    assert new_encoder.calls == [["alpha"]]
+    assert not np.allclose(old, new)
+
+
+def test_empty_text_is_embedded_but_not_cached(isolated_cache):
+    encoder = FakeEncoder()
+    embeddings = embed_with_cache(["", "alpha", "  "], text_cache_key, encoder, "enc-a")
+    assert embeddings.shape == (3, 2)
+    assert encoder.calls == [["", "alpha", "  "]]
+    assert len(list(isolated_cache.glob("*.npy"))) == 1
+
+    embed_with_cache(["", "alpha"], text_cache_key, encoder, "enc-a")
+    assert encoder.calls[-1] == [""]
+
+
+def test_disk_cache_is_capped(isolated_cache, monkeypatch):
+    monkeypatch.setattr(embedding_cache, "MAX_DISK_CACHE_ENTRIES", 3)
+    embed_with_cache([f"text {i}" for i in range(5)], text_cache_key, FakeEncoder(), "enc-a")
+    assert len(list(isolated_cache.glob("*.npy"))) == 3
+    assert prune_cache(1) == 1
+    assert len(list(isolated_cache.glob("*.npy"))) == 1
@@ -0,0 +1,43 @@
+"""Tests for inference_cache."""
+import os
+import numpy as np
+import pytest
+import inference_cache
+from inference_cache import load_cached_inference, pdf_cache_key, save_cached_inference
+
+
+@pytest.fixture(autouse=True)
+def isolated_cache(tmp_path, monkeypatch):
+    """Point the cache at a temp directory."""
+    cache_dir = tmp_path / "inference_cache"
+    monkeypatch.setattr(inference_cache, "get_cache_dir", lambda: str(cache_dir))
+    return cache_dir
+
+
+def _key(pdf_path, encoder_id="torch-fp32:clip-ViT-L-14", render_dpi=150):
+    train = np.eye(2, dtype=np.float32)
+    return pdf_cache_key(str(pdf_path), train, train, ["a.pdf", "b.pdf"], 0.8, encoder_id, render_dpi)
+
+
+def test_key_depends_on_encoder_and_render_dpi(tmp_path):
+    pdf_path = tmp_path / "composite.pdf"
+    pdf_path.write_bytes(b"%PDF-1.4 test")
+    key = _key(pdf_path)
+    assert key == _key(pdf_path)
+    assert key != _key(pdf_path, encoder_id="onnx-int8:clip-vit-l-14-vision.int8.onnx")
+    assert key != _key(pdf_path, render_dpi=200)
+
+
+def test_saved_entries_round_trip_and_are_capped(isolated_cache, monkeypatch):
+    monkeypatch.setattr(inference_cache, "MAX_CACHE_ENTRIES", 2)
+    embs = np.ones((3, 2), dtype=np.float32)
+    for i in range(4):
+        save_cached_inference(f"key{i}", embs, np.array([0, 2]), embs[:2])
+        # Distinct mtimes so the oldest entries are the ones pruned
+        path = isolated_cache / f"key{i}.npz"
+        os.utime(path, ns=(i * 10**9, i * 10**9))
+
+    assert sorted(p.name for p in isolated_cache.glob("*.npz")) == ["key2.npz", "key3.npz"]
+    cached = load_cached_inference("key3")
+    assert np.array_equal(cached["image_pages"], [0, 2])
+    assert load_cached_inference("key0") is None
@@ -0,0 +1,44 @@
+"""Tests for progress_tracker."""
+import asyncio
+import threading
+from progress_tracker import ProgressTracker
+
+
+def test_wait_for_update_wakes_on_change_from_another_thread():
+    job_id = ProgressTracker.create_job()
+
+    async def wait():
+        version, _ = await ProgressTracker.wait_for_update(job_id, -1)
+        timer = threading.Timer(0.05, ProgressTracker.complete_job, (job_id,))
+        timer.start()
+        result = await ProgressTracker.wait_for_update(job_id, version, timeout=5.0)
+        timer.join()
+        return version, result
+
+    try:
+        version, (new_version, progress) = asyncio.run(asyncio.wait_for(wait(), 2.0))
+    finally:
+        ProgressTracker.cleanup(job_id)
+
+    assert new_version == version + 1
+    assert progress["status"] == "completed"
+
+
+def test_wait_for_update_times_out_without_change():
+    job_id = ProgressTracker.create_job()
+    try:
+        version, _ = asyncio.run(ProgressTracker.wait_for_update(job_id, -1))
+        assert asyncio.run(ProgressTracker.wait_for_update(job_id, version, timeout=0.01))[0] == version
+    finally:
+        ProgressTracker.cleanup(job_id)
+
+
+def test_cleanup_wakes_waiters():
+    job_id = ProgressTracker.create_job()
+
+    async def wait():
+        version, _ = await ProgressTracker.wait_for_update(job_id, -1)
+        asyncio.get_running_loop().call_later(0.05, ProgressTracker.cleanup, job_id)
+        return await ProgressTracker.wait_for_update(job_id, version, timeout=5.0)
+
+    assert asyncio.run(asyncio.wait_for(wait(), 2.0)) == (0, None)
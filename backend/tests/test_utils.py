@@ -0,0 +1,120 @@
+"""Tests for utils."""
+import os
+import numpy as np
+import orjson
+import utils
+from utils import has_training_data, is_trained, load_embeddings, load_training_matrix, safe_filename
+
+
+def _baseline_safe_filename(filename):
+    """The original character loop safe_filename replaced."""
+    safe = "".join(c for c in filename if c.isalnum() or c in (' ', '-', '_', '.')).rstrip()
+    return safe.replace(' ', '_')
+
+
+def test_safe_filename_strips_special_characters():
+    assert safe_filename("My File (v2).pdf") == "My_File_v2.pdf"
+    assert safe_filename("a/b\\c..pdf  ") == "abc..pdf"
+
+
+def test_safe_filename_keeps_unicode_letters():
+    assert safe_filename("日本語：テスト.pdf") == "日本語テスト.pdf"
+    assert safe_filename("résumé.pdf") == "résumé.pdf"
+
+
+def test_safe_filename_strips_non_bmp_characters():
+    assert safe_filename("report 😀 v2.pdf") == "report__v2.pdf"
+    assert safe_filename("𝔘𝔫𝔦𝔠𝔬𝔡𝔢 📄.pdf") == _baseline_safe_filename("𝔘𝔫𝔦𝔠𝔬𝔡𝔢 📄.pdf")
+
+
+def test_safe_filename_matches_baseline():
+    names = ["Invoice #123.pdf", "  leading.pdf", "trailing_ ", "tab\there.pdf", "emoji🎉🎉.pdf", "ok-name_1.pdf"]
+    for name in names:
+        assert safe_filename(name) == _baseline_safe_filename(name)
+
+
+def test_is_trained_checks_membership(tmp_path):
+    store = tmp_path / "embeddings.jsonl"
+    assert not is_trained("a.pdf", str(store))
+
+    store.write_bytes(b'{"filename": "a.pdf"}\n')
+    assert is_trained("a.pdf", str(store))
+    assert not is_trained("b.pdf", str(store))
+
+
+def test_has_training_data_checks_the_store_file(tmp_path):
+    store = tmp_path / "embeddings.jsonl"
+    assert not has_training_data(str(store))
+
+    store.write_bytes(b"\n")
+    assert not has_training_data(str(store))
+
+    store.write_bytes(b'{"filename": "a.pdf"}\n')
+    assert has_training_data(str(store))
+
+
+def test_has_training_data_converts_a_legacy_store(tmp_path):
+    store = tmp_path / "embeddings.jsonl"
+    (tmp_path / "embeddings.json").write_bytes(b"{}")
+    assert not has_training_data(str(store))
+
+    (tmp_path / "embeddings.json").write_bytes(
+        b'{"a.pdf": {"filename": "a.pdf", "image_embedding": [1.0, 0.0], "text_embedding": [0.0, 1.0], "bbox": [0, 0, 1, 1]}}'
+    )
+    assert has_training_data(str(store))
+    assert store.exists()
+
+
+def test_load_embeddings_sees_a_write_within_the_same_mtime(tmp_path):
+    store = tmp_path / "embeddings.jsonl"
+    store.write_bytes(b'{"filename": "a.pdf"}\n')
+    stat = os.stat(store)
+    assert list(load_embeddings(str(store))) == ["a.pdf"]
+
+    # Another writer appends within the same timestamp tick
+    with open(store, "ab") as f:
+        f.write(b'{"filename": "b.pdf"}\n')
+    os.utime(store, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+    assert list(load_embeddings(str(store))) == ["a.pdf", "b.pdf"]
+
+
+def _store_line(filename, image, text):
+    return orjson.dumps({
+        "filename": filename,
+        "image_embedding": image,
+        "text_embedding": text,
+        "bbox": [0, 0, 1, 1]
+    }) + b"\n"
+
+
+def test_training_matrix_is_rebuilt_after_a_write_within_the_same_mtime(tmp_path):
+    store = tmp_path / "embeddings.jsonl"
+    store.write_bytes(_store_line("a.pdf", [1.0, 0.0], [0.0, 1.0]))
+    stat = os.stat(store)
+    _, _, names = load_training_matrix(str(store))
+    assert names == ["a.pdf"]
+
+    with open(store, "ab") as f:
+        f.write(_store_line("b.pdf", [0.0, 1.0], [1.0, 0.0]))
+    os.utime(store, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+    # Neither the in-process memo nor the .npy cache may be reused
+    for memo_cleared in (False, True):
+        if memo_cleared:
+            utils._training_matrix_memo.clear()
+        img_mat, txt_mat, names = load_training_matrix(str(store))
+        assert names == ["a.pdf", "b.pdf"]
+        assert img_mat.shape == (2, 2) and txt_mat.shape == (2, 2)
+
+
+def test_training_matrix_cache_is_reused_when_unchanged(tmp_path):
+    store = tmp_path / "embeddings.jsonl"
+    store.write_bytes(_store_line("a.pdf", [3.0, 4.0], [0.0, 2.0]))
+    load_training_matrix(str(store))
+    utils._training_matrix_memo.clear()
+
+    img_mat, txt_mat, names = load_training_matrix(str(store))
+    assert names == ["a.pdf"]
+    assert np.allclose(img_mat, [[0.6, 0.8]], atol=1e-3)
+    assert np.allclose(txt_mat, [[0.0, 1.0]], atol=1e-3)
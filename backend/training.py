@@ -1,85 +1,176 @@
 """Training pipeline for processing individual documents and storing embeddings."""
+import logging
 import os
-from typing import Dict, Tuple
-from pdf_processor import pdf_to_images, extract_text_from_page
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple
+from PIL import Image
+from pdf_processor import PdfContext
 from content_detector import detect_content_area, crop_to_content, get_content_area_with_visualization
-from embeddings import generate_image_embedding, generate_text_embedding
-from utils import add_training_embedding, get_backend_dir, ensure_directory
+from embeddings import (
+    generate_image_embeddings_batch, generate_text_embeddings_batch, get_image_encoder_id, TEXT_ENCODER_ID
+)
+from embedding_cache import image_cache_key, text_cache_key, embed_with_cache
+from utils import add_training_embedding, get_backend_dir, ensure_directory, safe_filename
 
 
-def process_training_document(pdf_path: str, filename: str) -> Dict:
+log = logging.getLogger(__name__)
+
+# Pipeline previews are saved here; created once rather than on every save
+_PREVIEW_DIR = os.path.join(get_backend_dir(), "data", "training_previews")
+ensure_directory(_PREVIEW_DIR)
+
+
+def _prepare_document(pdf_path: str) -> Tuple[Image.Image, str, Tuple[int, int, int, int], Image.Image]:
     """
-    Process a training document: detect content area, generate embeddings, and store.
+    Render a document's first page, extract its text, and crop it to its content.
     
     Args:
         pdf_path: Path to the PDF file
-        filename: Name of the file (used as key in embeddings storage)
     
     Returns:
-        Dictionary containing processing results including bbox and visualization data
+        Tuple of (first page image, first page text, bbox, cropped image)
     """
-    print(f"Processing training document: {filename}")
-    
-    # Get first page as image
-    print("Converting PDF to image...")
-    images = pdf_to_images(pdf_path)
-    if not images:
-        raise ValueError("PDF has no pages")
-    
-    first_page_image = images[0]
+    # Open the PDF once for both the first page image and its text
+    with PdfContext(pdf_path) as pdf:
+        if len(pdf) == 0:
+            raise ValueError("PDF has no pages")
+        first_page_image = pdf.get_image(0)
+        text = pdf.get_text(0)
     
-    # Detect content area
-    print("Detecting content area...")
     bbox = detect_content_area(first_page_image)
     cropped_image = crop_to_content(first_page_image, bbox)
     
-    # Generate embeddings
-    print("Generating image embedding...")
-    image_embedding = generate_image_embedding(cropped_image)
-    print("Generating text embedding...")
-    text = extract_text_from_page(pdf_path, 0)
-    text_embedding = generate_text_embedding(text)
+    return first_page_image, text, bbox, cropped_image
+
+
+def _save_previews(
+    executor: ThreadPoolExecutor,
+    filename: str,
+    first_page_image: Image.Image,
+    cropped_image: Image.Image
+) -> Tuple[str, str]:
+    """
+    Save pipeline preview images for later review.
     
-    # Save pipeline preview images for later review
-    preview_dir = os.path.join(get_backend_dir(), "data", "training_previews")
-    ensure_directory(preview_dir)
+    Args:
+        executor: Batch thread pool the two image saves run on
+        filename: Name of the training document
+        first_page_image: Rendered first page
+        cropped_image: First page cropped to its content area
     
+    Returns:
+        Tuple of (original image path, cropped image path)
+    """
     # Create safe filename (remove special characters)
-    safe_filename = "".join(c for c in filename if c.isalnum() or c in (' ', '-', '_', '.')).rstrip()
-    safe_filename = safe_filename.replace(' ', '_')
-    
-    original_path = os.path.join(preview_dir, f"{safe_filename}_original.png")
-    cropped_path = os.path.join(preview_dir, f"{safe_filename}_cropped.png")
-    
-    # Save images
-    first_page_image.save(original_path, "PNG")
-    cropped_image.save(cropped_path, "PNG")
-    
-    print(f"Saving pipeline preview images...")
-    print(f"  Original: {original_path}")
-    print(f"  Cropped: {cropped_path}")
-    
-    # Store embeddings with preview paths
-    print("Storing embeddings...")
-    add_training_embedding(
-        filename, 
-        image_embedding, 
-        text_embedding, 
-        bbox,
-        original_image_path=original_path,
-        cropped_image_path=cropped_path
-    )
-    
-    print(f"Training complete for {filename}!")
-    
-    # Return results for visualization
-    return {
-        "filename": filename,
-        "bbox": bbox,
-        "original_image": first_page_image,
-        "cropped_image": cropped_image,
-        "status": "success"
-    }
+    safe_name = safe_filename(filename)
+    
+    original_path = os.path.join(_PREVIEW_DIR, f"{safe_name}_original.png")
+    cropped_path = os.path.join(_PREVIEW_DIR, f"{safe_name}_cropped.jpg")
+    
+    # Save images. Previews only need to look right, so use the fastest zlib
+    # level for the original and JPEG for the crop; PIL releases the GIL
+    # while encoding, so the two saves run concurrently
+    original_future = executor.submit(first_page_image.save, original_path, "PNG", compress_level=1)
+    cropped_future = executor.submit(cropped_image.convert("RGB").save, cropped_path, "JPEG", quality=85)
+    original_future.result()
+    cropped_future.result()
+    
+    log.info("Saved pipeline preview images: %s, %s", original_path, cropped_path)
+    
+    return original_path, cropped_path
+
+
+def process_training_document(pdf_path: str, filename: str) -> Dict:
+    """
+    Process a training document: detect content area, generate embeddings, and store.
+    
+    Args:
+        pdf_path: Path to the PDF file
+        filename: Name of the file (used as key in embeddings storage)
+    
+    Returns:
+        Dictionary containing processing results including bbox and visualization data
+    """
+    return process_training_documents_batch([(pdf_path, filename)])[0]
+
+
+def process_training_documents_batch(documents: List[Tuple[str, str]]) -> List[Dict]:
+    """
+    Process several training documents, embedding them in one batch per modality.
+    
+    Documents are prepared on a thread pool, then all cropped images go
+    through a single CLIP batch and all texts through a single API request.
+    
+    Args:
+        documents: List of (pdf_path, filename) tuples
+    
+    Returns:
+        List of processing results, in the order of documents
+    """
+    if not documents:
+        return []
+    
+    log.info("Processing %d training document(s): %s", len(documents), ", ".join(filename for _, filename in documents))
+    
+    # One pool serves the whole batch: document preparation, the background
+    # text embedding request and the preview saves
+    with ThreadPoolExecutor(max_workers=max(2, min(len(documents), os.cpu_count() or 1))) as executor:
+        # Content detection releases the GIL, so threads overlap it across
+        # documents. PDFium rendering is serialized by its lock and pdfplumber
+        # text extraction is pure Python, so neither of those runs in parallel
+        log.info("Converting PDFs to images and detecting content areas...")
+        prepared = list(executor.map(_prepare_document, [pdf_path for pdf_path, _ in documents]))
+        
+        # Shares the inference embedding cache, so retraining an unchanged page
+        # (or a page already seen in a composite PDF) skips the model call.
+        # Text embeddings wait on the OpenAI API while image embeddings run CLIP
+        # locally, so the text request is issued in the background.
+        log.info("Generating image and text embeddings...")
+        text_future = executor.submit(
+            embed_with_cache,
+            [text for _, text, _, _ in prepared],
+            text_cache_key,
+            generate_text_embeddings_batch,
+            TEXT_ENCODER_ID
+        )
+        image_embeddings = embed_with_cache(
+            [cropped_image for _, _, _, cropped_image in prepared],
+            image_cache_key,
+            generate_image_embeddings_batch,
+            get_image_encoder_id()
+        )
+        text_embeddings = text_future.result()
+        
+        results = []
+        for (_, filename), (first_page_image, _, bbox, cropped_image), image_embedding, text_embedding in zip(
+            documents, prepared, image_embeddings, text_embeddings
+        ):
+            original_path, cropped_path = _save_previews(executor, filename, first_page_image, cropped_image)
+            
+            # Store embeddings with preview paths
+            log.info("Storing embeddings for %s...", filename)
+            add_training_embedding(
+                filename, 
+                image_embedding, 
+                text_embedding, 
+                bbox,
+                original_image_path=original_path,
+                cropped_image_path=cropped_path
+            )
+            
+            # Return results for visualization
+            results.append({
+                "filename": filename,
+                "bbox": bbox,
+                "original_image": first_page_image,
+                "cropped_image": cropped_image,
+                "original_image_path": original_path,
+                "cropped_image_path": cropped_path,
+                "status": "success"
+            })
+    
+    log.info("Training complete for %d document(s)", len(results))
+    return results
 
 
 def get_training_pipeline_preview(pdf_path: str) -> Dict:
@@ -92,11 +183,11 @@ def get_training_pipeline_preview(pdf_path: str) -> Dict:
     Returns:
         Dictionary containing original image, bbox, and cropped image
     """
-    images = pdf_to_images(pdf_path)
-    if not images:
-        raise ValueError("PDF has no pages")
+    with PdfContext(pdf_path) as pdf:
+        if len(pdf) == 0:
+            raise ValueError("PDF has no pages")
+        first_page_image = pdf.get_image(0)
     
-    first_page_image = images[0]
     original, bbox, cropped = get_content_area_with_visualization(first_page_image)
     
     return {
@@ -1,14 +1,21 @@
 """Utility functions for file handling and data management."""
-import json
+import base64
 import os
+import threading
 from pathlib import Path
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional, Tuple
+import numpy as np
+import orjson
+
+
+# Resolved once at import; the backend directory never moves while running
+_BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+_DEFAULT_EMBEDDINGS_PATH = os.path.join(_BACKEND_DIR, "data", "embeddings.jsonl")
 
 
 def get_backend_dir():
     """Get the backend directory path."""
-    current_file = os.path.abspath(__file__)
-    return os.path.dirname(current_file)
+    return _BACKEND_DIR
 
 
 def ensure_directory(path: str):
@@ -16,61 +23,291 @@ def ensure_directory(path: str):
     Path(path).mkdir(parents=True, exist_ok=True)
 
 
+def prune_oldest_files(directory: str, suffix: str, max_entries: int) -> Tuple[int, int]:
+    """
+    Delete the oldest written files with a suffix beyond max_entries.
+    
+    Used to cap the on-disk caches, whose entries are never rewritten in
+    place.
+    
+    Args:
+        directory: Directory holding the files
+        suffix: File name suffix of the entries, e.g. ".npy"
+        max_entries: Number of files to keep
+    
+    Returns:
+        Tuple of (files left, files removed)
+    """
+    if not os.path.isdir(directory):
+        return 0, 0
+    
+    entries = []
+    with os.scandir(directory) as it:
+        for entry in it:
+            if not entry.name.endswith(suffix):
+                continue
+            try:
+                entries.append((entry.stat().st_mtime_ns, entry.path))
+            except FileNotFoundError:
+                continue
+    if len(entries) <= max_entries:
+        return len(entries), 0
+    
+    entries.sort()
+    removed = 0
+    for _, path in entries[:len(entries) - max_entries]:
+        try:
+            os.remove(path)
+            removed += 1
+        except FileNotFoundError:
+            continue
+    return len(entries) - removed, removed
+
+
+class _SafeFilenameTable(dict):
+    """
+    str.translate table deleting the characters a filename may not contain.
+    
+    Letters, digits, space, '-', '_' and '.' are kept. Code points are
+    classified on first use and memoized, so the table covers all of
+    Unicode without being built up front.
+    """
+    
+    def __missing__(self, code: int):
+        char = chr(code)
+        value = code if char.isalnum() or char in " -_." else None
+        self[code] = value
+        return value
+
+
+_SAFE_FILENAME_TABLE = _SafeFilenameTable()
+
+
+def safe_filename(filename: str) -> str:
+    """
+    Make a document name safe to use in a file name.
+    
+    Args:
+        filename: Name of the document
+    
+    Returns:
+        Name without special characters, with spaces replaced by underscores
+    """
+    return filename.translate(_SAFE_FILENAME_TABLE).rstrip().replace(' ', '_')
+
+
+def get_legacy_embeddings_path(embeddings_path: str) -> str:
+    """Get the path of the whole-file JSON store that preceded an embeddings JSONL file."""
+    return f"{os.path.splitext(embeddings_path)[0]}.json"
+
+
+def _file_version(path: str) -> Tuple[int, int]:
+    """
+    Get the (mtime_ns, size) of a file, identifying its contents for caching.
+    
+    mtime alone misses two writes within one timestamp tick (coarse
+    filesystems, quick successive appends); the size catches those.
+    """
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+# embeddings_path -> (file version, embeddings data), so repeated loads
+# only stat the file until it changes
+_embeddings_cache: Dict[str, Tuple[Tuple[int, int], Dict[str, Any]]] = {}
+# Reentrant because migration and compaction save while a load holds it
+_embeddings_lock = threading.RLock()
+
+
 def load_embeddings(embeddings_path: str = None) -> Dict[str, Any]:
     """
-    Load embeddings from JSON file.
+    Load embeddings from the JSONL store.
+    
+    Each line holds one training document; a document retrained later is
+    appended again, and the last line for a filename wins. An
+    embeddings.json file from before the JSONL store is converted on
+    first read. The parsed data is kept in-process and reused until the
+    file's mtime or size changes.
     
     Args:
-        embeddings_path: Path to embeddings JSON file
+        embeddings_path: Path to embeddings JSONL file
     
     Returns:
         Dictionary containing embeddings data
+        The dictionary is shared between callers and must not be modified.
     """
     if embeddings_path is None:
-        embeddings_path = os.path.join(get_backend_dir(), "data", "embeddings.json")
+        embeddings_path = _DEFAULT_EMBEDDINGS_PATH
     
-    if not os.path.exists(embeddings_path):
+    with _embeddings_lock:
+        if not os.path.exists(embeddings_path):
+            return _migrate_legacy_embeddings(embeddings_path)
+        
+        version = _file_version(embeddings_path)
+        cached = _embeddings_cache.get(embeddings_path)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        
+        embeddings_data = {}
+        line_count = 0
+        try:
+            with open(embeddings_path, 'rb') as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    line_count += 1
+                    try:
+                        entry = orjson.loads(line)
+                    except orjson.JSONDecodeError:
+                        # A write interrupted mid-line leaves a truncated record; skip it
+                        print(f"Warning: Skipping invalid line {line_count} in {embeddings_path}")
+                        continue
+                    embeddings_data[entry["filename"]] = entry
+        except Exception as e:
+            raise Exception(f"Error loading embeddings: {str(e)}")
+        
+        # Compact once superseded lines from retraining outnumber live entries
+        if line_count > 2 * len(embeddings_data):
+            save_embeddings(embeddings_data, embeddings_path)
+        else:
+            _embeddings_cache[embeddings_path] = (version, embeddings_data)
+        
+        return embeddings_data
+
+
+def is_trained(filename: str, embeddings_path: str = None) -> bool:
+    """
+    Check whether a document is in the training data.
+    
+    Uses the in-process copy of the store, which appends keep current, so
+    after the first load this is a stat and a dictionary lookup.
+    
+    Args:
+        filename: Name of the training document
+        embeddings_path: Path to embeddings JSONL file
+    
+    Returns:
+        True if the document has stored embeddings
+    """
+    return filename in load_embeddings(embeddings_path)
+
+
+def has_training_data(embeddings_path: str = None) -> bool:
+    """
+    Check whether any training document has been stored, without parsing the store.
+    
+    Lines are only ever appended (and compaction keeps one per document), so
+    a store with a non-blank line holds at least one document; only the
+    first line is read. An embeddings.json from before the JSONL store is
+    converted first.
+    
+    Args:
+        embeddings_path: Path to embeddings JSONL file
+    
+    Returns:
+        True if at least one document has stored embeddings
+    """
+    if embeddings_path is None:
+        embeddings_path = _DEFAULT_EMBEDDINGS_PATH
+    
+    try:
+        with open(embeddings_path, 'rb') as f:
+            return any(line.strip() for line in f)
+    except FileNotFoundError:
+        return os.path.exists(get_legacy_embeddings_path(embeddings_path)) and bool(load_embeddings(embeddings_path))
+
+
+def _migrate_legacy_embeddings(embeddings_path: str) -> Dict[str, Any]:
+    """Convert a legacy embeddings.json next to embeddings_path to JSONL, if present."""
+    legacy_path = get_legacy_embeddings_path(embeddings_path)
+    if legacy_path == embeddings_path or not os.path.exists(legacy_path):
         return {}
     
     try:
-        with open(embeddings_path, 'r', encoding='utf-8') as f:
+        with open(legacy_path, 'rb') as f:
             content = f.read().strip()
-            # If file is empty, return empty dict
-            if not content:
-                return {}
-            return json.loads(content)
-    except json.JSONDecodeError:
-        # If JSON is invalid, return empty dict and optionally fix the file
-        print(f"Warning: Invalid JSON in {embeddings_path}, initializing empty embeddings.")
+            embeddings_data = orjson.loads(content) if content else {}
+    except orjson.JSONDecodeError:
+        print(f"Warning: Invalid JSON in {legacy_path}, initializing empty embeddings.")
         return {}
-    except Exception as e:
-        raise Exception(f"Error loading embeddings: {str(e)}")
+    
+    if embeddings_data:
+        print(f"Converting {legacy_path} to {embeddings_path}...")
+        save_embeddings(embeddings_data, embeddings_path)
+    return embeddings_data
 
 
 def save_embeddings(embeddings_data: Dict[str, Any], embeddings_path: str = None):
     """
-    Save embeddings to JSON file.
+    Rewrite the JSONL store with one line per document.
+    
+    The store is written to a temp file and renamed over the original, so
+    readers and crashes never see a partial file.
     
     Args:
         embeddings_data: Dictionary containing embeddings data
-        embeddings_path: Path to embeddings JSON file
+        embeddings_path: Path to embeddings JSONL file
     """
     if embeddings_path is None:
-        embeddings_path = os.path.join(get_backend_dir(), "data", "embeddings.json")
+        embeddings_path = _DEFAULT_EMBEDDINGS_PATH
     
     ensure_directory(os.path.dirname(embeddings_path))
     
-    try:
-        with open(embeddings_path, 'w', encoding='utf-8') as f:
-            json.dump(embeddings_data, f, indent=2, ensure_ascii=False)
-    except Exception as e:
-        raise Exception(f"Error saving embeddings: {str(e)}")
+    # Rewrites also move legacy float-list entries to the compact encoding
+    embeddings_data = {filename: _encode_entry(entry) for filename, entry in embeddings_data.items()}
+    
+    tmp_path = f"{embeddings_path}.tmp"
+    with _embeddings_lock:
+        try:
+            with open(tmp_path, 'wb') as f:
+                for entry in embeddings_data.values():
+                    f.write(orjson.dumps(entry, option=orjson.OPT_SERIALIZE_NUMPY) + b"\n")
+            os.replace(tmp_path, embeddings_path)
+        except Exception as e:
+            raise Exception(f"Error saving embeddings: {str(e)}")
+        
+        _embeddings_cache[embeddings_path] = (_file_version(embeddings_path), embeddings_data)
+
+
+def append_embedding(entry: Dict[str, Any], embeddings_path: str = None):
+    """
+    Append one document's embeddings to the JSONL store without rewriting it.
+    
+    Args:
+        entry: Embeddings data for one document, including its filename
+        embeddings_path: Path to embeddings JSONL file
+    """
+    if embeddings_path is None:
+        embeddings_path = _DEFAULT_EMBEDDINGS_PATH
+    
+    ensure_directory(os.path.dirname(embeddings_path))
+    
+    with _embeddings_lock:
+        # Convert a legacy store first so its documents aren't shadowed
+        if not os.path.exists(embeddings_path):
+            _migrate_legacy_embeddings(embeddings_path)
+        
+        previous_version = _file_version(embeddings_path) if os.path.exists(embeddings_path) else None
+        
+        try:
+            with open(embeddings_path, 'ab') as f:
+                f.write(orjson.dumps(entry, option=orjson.OPT_SERIALIZE_NUMPY) + b"\n")
+        except Exception as e:
+            raise Exception(f"Error saving embeddings: {str(e)}")
+        
+        # Keep the in-process copy current if it was current before the append;
+        # copy rather than mutate, since callers may be iterating the old dict
+        cached = _embeddings_cache.get(embeddings_path)
+        if cached is not None and cached[0] == previous_version:
+            embeddings_data = dict(cached[1])
+            embeddings_data[entry["filename"]] = entry
+            _embeddings_cache[embeddings_path] = (_file_version(embeddings_path), embeddings_data)
 
 
 def add_training_embedding(
     filename: str,
-    image_embedding: List[float],
-    text_embedding: List[float],
+    image_embedding: np.ndarray,
+    text_embedding: np.ndarray,
     bbox: tuple,
     embeddings_path: str = None,
     original_image_path: str = None,
@@ -84,23 +321,212 @@ def add_training_embedding(
         image_embedding: Image embedding vector
         text_embedding: Text embedding vector
         bbox: Bounding box of content area (x, y, w, h)
-        embeddings_path: Path to embeddings JSON file
+        embeddings_path: Path to embeddings JSONL file
         original_image_path: Path to saved original image
         cropped_image_path: Path to saved cropped image
     """
-    if embeddings_path is None:
-        embeddings_path = os.path.join(get_backend_dir(), "data", "embeddings.json")
-    
-    embeddings_data = load_embeddings(embeddings_path)
+    # Take one C-contiguous float32 layout up front, whatever the caller passed
+    # (list, strided batch row, other dtype), so nothing downstream copies again
+    image_embedding = np.ascontiguousarray(image_embedding, dtype=np.float32).reshape(1, -1)
+    text_embedding = np.ascontiguousarray(text_embedding, dtype=np.float32).reshape(1, -1)
     
-    embeddings_data[filename] = {
-        "image_embedding": image_embedding,
-        "text_embedding": text_embedding,
+    # Store unit-length vectors so cosine similarity reduces to a dot product
+    append_embedding({
+        "image_embedding_b64": _encode_vec(normalize_rows(image_embedding)[0]),
+        "text_embedding_b64": _encode_vec(normalize_rows(text_embedding)[0]),
         "bbox": bbox,
         "filename": filename,
         "original_image_path": original_image_path,
         "cropped_image_path": cropped_image_path
+    }, embeddings_path)
+
+
+def _encode_vec(vector: np.ndarray) -> str:
+    """Encode an embedding as base64 of its float16 bytes (a quarter of the JSON float size)."""
+    return base64.b64encode(np.asarray(vector, dtype=np.float16).tobytes()).decode('ascii')
+
+
+def _decode_vec(entry: Dict[str, Any], field: str) -> np.ndarray:
+    """
+    Decode an embedding field of a stored document.
+    
+    Args:
+        entry: Embeddings data for one document
+        field: "image_embedding" or "text_embedding"
+    
+    Returns:
+        float32 vector, from the float16 base64 form or a legacy float list
+    """
+    encoded = entry.get(f"{field}_b64")
+    if encoded is not None:
+        return np.frombuffer(base64.b64decode(encoded), dtype=np.float16).astype(np.float32)
+    return np.asarray(entry[field], dtype=np.float32)
+
+
+def _encode_entry(entry: Dict[str, Any]) -> Dict[str, Any]:
+    """Convert a document entry with legacy float-list embeddings to the base64 float16 form."""
+    if "image_embedding" not in entry and "text_embedding" not in entry:
+        return entry
+    
+    encoded = {key: value for key, value in entry.items() if key not in ("image_embedding", "text_embedding")}
+    for field in ("image_embedding", "text_embedding"):
+        encoded[f"{field}_b64"] = _encode_vec(normalize_rows([_decode_vec(entry, field)])[0])
+    return encoded
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """L2-normalize each row of a matrix, leaving all-zero rows as zeros."""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+# embeddings_path -> (file version, (image matrix, text matrix, filenames))
+_training_matrix_memo: Dict[str, Tuple[Tuple[int, int], Tuple[np.ndarray, np.ndarray, List[str]]]] = {}
+
+
+def _training_matrix_paths(embeddings_path: str) -> Dict[str, str]:
+    """Get the cache file paths for the training matrix of an embeddings file."""
+    base = os.path.splitext(embeddings_path)[0]
+    return {
+        "img": f"{base}.img.npy",
+        "txt": f"{base}.txt.npy",
+        "names": f"{base}.names.json"
     }
+
+
+def load_training_matrix(embeddings_path: str = None) -> Tuple[np.ndarray, np.ndarray, List[str]]:
+    """
+    Load training embeddings as row-normalized float32 matrices.
     
-    save_embeddings(embeddings_data, embeddings_path)
+    The matrices are cached as float16 .npy files next to the embeddings
+    file (half the size of float32) and memory-mapped on load, then upcast
+    to float32 for BLAS. The names file records the (mtime_ns, size) of the
+    embeddings file the cache was built from, and the cache is rebuilt
+    whenever that no longer matches. Matrices are also kept in-process per
+    embeddings file, so repeated inference runs only stat the file until it
+    changes.
+    
+    Args:
+        embeddings_path: Path to embeddings JSONL file
+    
+    Returns:
+        Tuple of (image matrix (T, D_img), text matrix (T, D_txt), filenames)
+        The matrices are shared between callers and must not be modified.
+    """
+    if embeddings_path is None:
+        embeddings_path = _DEFAULT_EMBEDDINGS_PATH
+    
+    paths = _training_matrix_paths(embeddings_path)
+    
+    if not os.path.exists(embeddings_path):
+        # Converts a legacy embeddings.json, if there is one
+        load_embeddings(embeddings_path)
+        if not os.path.exists(embeddings_path):
+            return np.empty((0, 0), dtype=np.float32), np.empty((0, 0), dtype=np.float32), []
+    
+    # Reuse the matrices built by a previous call while the file is unchanged
+    json_version = _file_version(embeddings_path)
+    cached = _training_matrix_memo.get(embeddings_path)
+    if cached is not None and cached[0] == json_version:
+        return cached[1]
+    
+    cached = _read_training_matrix_cache(paths, json_version)
+    if cached is not None:
+        _training_matrix_memo[embeddings_path] = (json_version, cached)
+        return cached
+    
+    embeddings_data = load_embeddings(embeddings_path)
+    if not embeddings_data:
+        return np.empty((0, 0), dtype=np.float32), np.empty((0, 0), dtype=np.float32), []
+    
+    return _write_training_matrix(embeddings_path, embeddings_data, json_version)
+
+
+def _read_training_matrix_cache(
+    paths: Dict[str, str],
+    json_version: Tuple[int, int]
+) -> Optional[Tuple[np.ndarray, np.ndarray, List[str]]]:
+    """Memory-map the .npy cache if it was built from this version of the embeddings file, else None."""
+    if not all(os.path.exists(path) for path in paths.values()):
+        return None
+    
+    try:
+        with open(paths["names"], 'rb') as f:
+            meta = orjson.loads(f.read())
+        # Caches from before the source version was recorded hold a bare list
+        if not isinstance(meta, dict) or tuple(meta.get("source", ())) != json_version:
+            return None
+        names = meta["names"]
+        img_mat = np.load(paths["img"], mmap_mode='r').astype(np.float32, copy=False)
+        txt_mat = np.load(paths["txt"], mmap_mode='r').astype(np.float32, copy=False)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Warning: Ignoring unreadable training matrix cache: {str(e)}")
+        return None
+    
+    # Guards against matrices and names from two different rebuilds
+    if img_mat.shape[0] != len(names) or txt_mat.shape[0] != len(names):
+        return None
+    return img_mat, txt_mat, names
+
 
+def _embeddings_to_matrices(embeddings_data: Dict[str, Any]) -> Tuple[List[str], np.ndarray, np.ndarray]:
+    """Decode every document's embeddings into preallocated, row-normalized float32 matrices."""
+    names = list(embeddings_data.keys())
+    entries = list(embeddings_data.values())
+    if not entries:
+        return names, np.empty((0, 0), dtype=np.float32), np.empty((0, 0), dtype=np.float32)
+    
+    matrices = []
+    for field in ("image_embedding", "text_embedding"):
+        # Size the buffer from the first entry and write each row into it,
+        # rather than stacking a list of per-document vectors
+        first = _decode_vec(entries[0], field)
+        matrix = np.empty((len(entries), first.size), dtype=np.float32)
+        matrix[0] = normalize_rows(first[np.newaxis])[0]
+        for row, entry in enumerate(entries[1:], start=1):
+            matrix[row] = normalize_rows(_decode_vec(entry, field)[np.newaxis])[0]
+        matrices.append(matrix)
+    
+    return names, matrices[0], matrices[1]
+
+
+def _write_training_matrix(
+    embeddings_path: str,
+    embeddings_data: Dict[str, Any],
+    json_version: Tuple[int, int] = None
+) -> Tuple[np.ndarray, np.ndarray, List[str]]:
+    """
+    Build the training matrices from embeddings data and write the .npy cache.
+    
+    Args:
+        embeddings_path: Path to embeddings JSONL file (already saved)
+        embeddings_data: Dictionary containing embeddings data
+        json_version: (mtime_ns, size) of the file the data was read from (default: stat it now)
+    
+    Returns:
+        Tuple of (image matrix, text matrix, filenames)
+    """
+    names, img_mat, txt_mat = _embeddings_to_matrices(embeddings_data)
+    if json_version is None:
+        json_version = _file_version(embeddings_path)
+    
+    paths = _training_matrix_paths(embeddings_path)
+    try:
+        # float16 rounds each component by ~5e-4 relative. Each file
+        # is renamed into place so readers never map a partial matrix, and
+        # the names file, which records the source version, goes last
+        for key, matrix in (("img", img_mat), ("txt", txt_mat)):
+            with open(f"{paths[key]}.tmp", 'wb') as f:
+                np.save(f, matrix.astype(np.float16))
+            os.replace(f"{paths[key]}.tmp", paths[key])
+        with open(f"{paths['names']}.tmp", 'wb') as f:
+            f.write(orjson.dumps({"source": list(json_version), "names": names}))
+        os.replace(f"{paths['names']}.tmp", paths["names"])
+    except OSError as e:
+        # Cache is an optimization only; fall back to the in-memory matrices
+        print(f"Warning: Could not write training matrix cache: {str(e)}")
+    
+    _training_matrix_memo[embeddings_path] = (json_version, (img_mat, txt_mat, names))
+    return img_mat, txt_mat, names
@@ -1,7 +1,7 @@
 import { useState, useEffect } from 'react';
 import FileUpload from '../components/FileUpload';
 import PDFPreview from '../components/PDFPreview';
-import { runInference, downloadFile, getInferenceProgress } from '../services/api';
+import { runInference, downloadFile, inferenceProgressStreamUrl } from '../services/api';
 import './Inference.css';
 
 function Inference() {
@@ -14,47 +14,40 @@ function Inference() {
   const [jobId, setJobId] = useState(null);
 
   useEffect(() => {
-    let intervalId = null;
+    let eventSource = null;
     
     if (jobId && processing) {
-      // Poll for progress updates
-      const pollProgress = async () => {
-        try {
-          const progressData = await getInferenceProgress(jobId);
-          console.log('Progress data:', progressData); // Debug log
-          setProgress(progressData);
-          
-          if (progressData.status === 'completed') {
-            setProcessing(false);
-            setSplitDocuments(progressData.result?.split_documents || []);
-            setProgress(null);
-            setJobId(null);
-            if (intervalId) {
-              clearInterval(intervalId);
-            }
-          } else if (progressData.status === 'failed') {
-            setProcessing(false);
-            setError(progressData.error || 'Processing failed');
-            setProgress(null);
-            setJobId(null);
-            if (intervalId) {
-              clearInterval(intervalId);
-            }
-          }
-        } catch (err) {
-          console.error('Error fetching progress:', err);
-          // Don't stop polling on error, might be temporary
+      // Subscribe to progress updates pushed by the server
+      eventSource = new EventSource(inferenceProgressStreamUrl(jobId));
+      
+      eventSource.onmessage = (event) => {
+        const progressData = JSON.parse(event.data);
+        setProgress(progressData);
+        
+        if (progressData.status === 'completed') {
+          setProcessing(false);
+          setSplitDocuments(progressData.result?.split_documents || []);
+          setProgress(null);
+          setJobId(null);
+          eventSource.close();
+        } else if (progressData.status === 'failed') {
+          setProcessing(false);
+          setError(progressData.error || 'Processing failed');
+          setProgress(null);
+          setJobId(null);
+          eventSource.close();
         }
       };
       
-      // Poll immediately, then set interval
-      pollProgress();
-      intervalId = setInterval(pollProgress, 500); // Poll every 500ms
+      eventSource.onerror = (err) => {
+        console.error('Error receiving progress:', err);
+        // EventSource reconnects on its own, might be temporary
+      };
     }
     
     return () => {
-      if (intervalId) {
-        clearInterval(intervalId);
+      if (eventSource) {
+        eventSource.close();
       }
     };
   }, [jobId, processing]);
@@ -151,7 +144,13 @@ function Inference() {
                   <div 
                     key={idx} 
                     className={`page-indicator ${page.matched ? 'matched' : ''}`}
-                    title={page.matched ? `Matched: ${page.best_match}` : 'No match'}
+                    title={
+                      page.matched
+                        ? `Matched: ${page.best_match}`
+                        : page.prefiltered
+                          ? 'No match (text too dissimilar; image not compared)'
+                          : 'No match'
+                    }
                   >
                     <span className="page-number">{page.page}</span>
                     {page.matched && <span className="match-badge">✓</span>}
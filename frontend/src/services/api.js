@@ -9,12 +9,22 @@ const api = axios.create({
   },
 });
 
+// Saved previews come back as backend-relative URLs; data URIs pass through
+const withPreviewUrls = (data) => {
+  const toAbsolute = (url) => (url && url.startsWith('/') ? `${API_BASE_URL}${url}` : url);
+  return {
+    ...data,
+    original_image: toAbsolute(data.original_image),
+    cropped_image: toAbsolute(data.cropped_image),
+  };
+};
+
 export const trainModel = async (file) => {
   const formData = new FormData();
   formData.append('file', file);
   
   const response = await api.post('/api/train', formData);
-  return response.data;
+  return withPreviewUrls(response.data);
 };
 
 export const runInference = async (file) => {
@@ -44,7 +54,11 @@ export const previewPipeline = async (file) => {
 
 export const getTrainingPreview = async (filename) => {
   const response = await api.get(`/api/training-preview/${encodeURIComponent(filename)}`);
-  return response.data;
+  return withPreviewUrls(response.data);
+};
+
+export const inferenceProgressStreamUrl = (jobId) => {
+  return `${API_BASE_URL}/api/inference/progress/${jobId}/stream`;
 };
 
 export const getInferenceProgress = async (jobId) => {